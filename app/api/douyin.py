@@ -1,16 +1,66 @@
 """
 抖音相关的API路由
 """
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
 import logging
-from app.models.douyin import DouyinUrlRequest, DouyinPageResponse
+from typing import Optional
+from app.models.douyin import (
+    DouyinUrlRequest, DouyinPageResponse, LongScreenshotRequest, BatchScreenshotRequest,
+    JobSubmitResponse, JobStatusResponse
+)
 from app.services.playwright_service import playwright_service
+from app.services.job_service import job_service, JobQueueFullError
+from app.services.batch_service import batch_service
+from app.services.capture_service import capture_service
+from app.services.admission_service import admission_controller, AdmissionRejectedError
+from app.core.config import settings
+from app.utils.file_stream import file_response, cached_file_response, resolve_file, with_download_urls, download_url
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/douyin", tags=["抖音"])
 
+# 检查客户端是否断开连接的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# SSE连接没有新事件时发送心跳注释的间隔（秒），避免被代理断开
+SSE_KEEPALIVE_INTERVAL = 15.0
+
+def _too_many_requests(error: AdmissionRejectedError) -> HTTPException:
+    """排队已满时返回429，并告知客户端重试等待时间"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={
+            "Retry-After": str(error.retry_after),
+            "X-Queue-Depth": str(error.queue_depth)
+        }
+    )
+
+async def _cancel_on_disconnect(http_request: Request, awaitable):
+    """
+    等待截图完成，期间客户端断开连接时取消截图
+
+    Raises:
+        HTTPException: 客户端已断开连接(499)
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("客户端已断开连接，取消截图")
+                raise HTTPException(status_code=499, detail="客户端已断开连接")
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
 @router.post("/open", response_model=DouyinPageResponse)
 async def open_douyin_url(request: DouyinUrlRequest):
     """
@@ -28,7 +78,8 @@ async def open_douyin_url(request: DouyinUrlRequest):
             await playwright_service.initialize()
         
         # 打开抖音链接
-        result = await playwright_service.open_douyin_url(str(request.url))
+        async with admission_controller.slot(priority="interactive"):
+            result = await playwright_service.open_douyin_url(str(request.url))
         
         if result.get("success"):
             return DouyinPageResponse(**result)
@@ -38,6 +89,8 @@ async def open_douyin_url(request: DouyinUrlRequest):
                 detail=f"打开链接失败: {result.get('error', '未知错误')}"
             )
             
+    except AdmissionRejectedError as e:
+        raise _too_many_requests(e)
     except Exception as e:
         logger.error(f"处理抖音链接时出错: {e}")
         raise HTTPException(
@@ -63,7 +116,8 @@ async def test_douyin_link():
                 )
         
         # 打开测试链接
-        result = await playwright_service.open_douyin_url(test_url)
+        async with admission_controller.slot(priority="interactive"):
+            result = await playwright_service.open_douyin_url(test_url)
         
         return {
             "message": "测试完成",
@@ -71,6 +125,8 @@ async def test_douyin_link():
             "result": result
         }
         
+    except AdmissionRejectedError as e:
+        raise _too_many_requests(e)
     except Exception as e:
         logger.error(f"测试抖音链接时出错: {e}")
         raise HTTPException(
@@ -79,40 +135,55 @@ async def test_douyin_link():
         )
 
 @router.post("/long-screenshot")
-async def take_long_screenshot(request: DouyinUrlRequest):
+async def take_long_screenshot(request: LongScreenshotRequest, http_request: Request):
     """
     对抖音页面进行长截图
     
+    客户端断开连接时截图会被取消；超过截止时间时返回504。
+    
     Args:
-        request: 包含抖音链接的请求对象
+        request: 包含抖音链接和输出选项的请求对象
         
     Returns:
         长截图结果信息
     """
     try:
-        # 确保浏览器已初始化
-        if not playwright_service.browser:
-            init_result = await playwright_service.initialize()
-            if not init_result:
-                raise HTTPException(
-                    status_code=500,
-                    detail="浏览器初始化失败"
-                )
-        
-        # 执行长截图
-        result = await playwright_service.take_long_screenshot(str(request.url))
+        # 执行长截图（按请求的cache策略使用结果缓存，必要时初始化浏览器）
+        result = await _cancel_on_disconnect(
+            http_request, capture_service.capture(str(request.url), request, priority="interactive")
+        )
         
-        if result.get("success"):
-            return {
-                "message": "长截图完成",
-                "data": result
-            }
-        else:
+        if request.cache == "only" and result.get("cache") == "miss":
+            raise HTTPException(status_code=404, detail="缓存未命中")
+        if result.get("timeout"):
+            raise HTTPException(status_code=504, detail=result.get("error"))
+        if not result.get("success"):
             raise HTTPException(
                 status_code=400,
                 detail=f"长截图失败: {result.get('error', '未知错误')}"
             )
+        
+        if request.return_image:
+            if result.get("segments"):
+                raise HTTPException(
+                    status_code=400,
+                    detail="结果已分段输出，请通过下载接口逐段获取"
+                )
+            # 元数据通过响应头返回，响应体为图片内容
+            return file_response(result["output_path"], headers={
+                "X-Screenshot-Count": str(result["screenshot_count"]),
+                "X-Total-Height": str(result["total_height"])
+            })
+        
+        return {
+            "message": "长截图完成",
+            "data": with_download_urls(result)
+        }
             
+    except HTTPException:
+        raise
+    except AdmissionRejectedError as e:
+        raise _too_many_requests(e)
     except Exception as e:
         logger.error(f"长截图时出错: {e}")
         raise HTTPException(
@@ -120,6 +191,140 @@ async def take_long_screenshot(request: DouyinUrlRequest):
             detail=f"服务器内部错误: {str(e)}"
         )
 
+@router.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_long_screenshot_job(request: LongScreenshotRequest):
+    """
+    提交长截图任务，立即返回任务ID
+    
+    Args:
+        request: 包含抖音链接和输出选项的请求对象
+        
+    Returns:
+        任务ID及状态查询地址
+    """
+    try:
+        job = job_service.submit(
+            str(request.url), request,
+            callback_url=str(request.callback_url) if request.callback_url else None,
+            callback_include_image=request.callback_include_image
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return JobSubmitResponse(
+        job_id=job.id,
+        status=job.status,
+        status_url=f"{router.prefix}/jobs/{job.id}",
+        result_url=f"{router.prefix}/jobs/{job.id}/result"
+    )
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_long_screenshot_job(job_id: str):
+    """查询长截图任务状态和进度"""
+    job = job_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    return JobStatusResponse(**job.to_dict())
+
+@router.get("/jobs/{job_id}/events")
+async def stream_long_screenshot_job_events(job_id: str, frames: bool = False,
+                                            last_event_id: Optional[str] = Header(None)):
+    """
+    以Server-Sent Events推送任务事件，任务结束后关闭连接
+    
+    事件类型为stage字段：queued、running、navigating、preloading、frame、stitching，
+    最后是succeeded或failed。事件id为序号，断线重连时通过Last-Event-ID从下一个事件继续。
+    
+    Args:
+        job_id: 任务ID
+        frames: 为frame事件附带frame_url，客户端可以在拼接完成前逐帧加载已截取的部分
+    """
+    job = job_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    
+    async def event_stream():
+        index = start
+        while True:
+            while index < len(job.events):
+                event = dict(job.events[index])
+                if frames and event["stage"] == "frame" and event.get("path"):
+                    event["frame_url"] = download_url(event["path"])
+                if event["stage"] == "succeeded":
+                    event["result_url"] = f"{router.prefix}/jobs/{job.id}/result"
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"id: {index}\nevent: {event['stage']}\ndata: {data}\n\n"
+                index += 1
+            if job.finished:
+                break
+            if not await job.wait_for_event(index, SSE_KEEPALIVE_INTERVAL):
+                yield ": keepalive\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@router.get("/jobs/{job_id}/result")
+async def get_long_screenshot_job_result(job_id: str):
+    """获取长截图任务结果，任务未完成时返回409"""
+    job = job_service.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    if not job.finished:
+        raise HTTPException(status_code=409, detail=f"任务尚未完成: {job.status}")
+    if job.status == "failed":
+        raise HTTPException(status_code=400, detail=f"长截图失败: {job.error}")
+    
+    return {
+        "message": "长截图完成",
+        "data": with_download_urls(job.result)
+    }
+
+@router.post("/batch")
+async def batch_long_screenshot(request: BatchScreenshotRequest):
+    """
+    批量长截图，以NDJSON流的形式按完成顺序返回每个URL的结果
+    
+    Args:
+        request: URL列表和共享的输出选项
+        
+    Returns:
+        每行一个JSON对象，包含index、url和截图结果
+    """
+    if len(request.urls) > settings.batch_max_urls:
+        raise HTTPException(
+            status_code=400,
+            detail=f"URL数量超出限制: {len(request.urls)} > {settings.batch_max_urls}"
+        )
+    
+    async def stream_results():
+        async for item in batch_service.run([str(url) for url in request.urls], request, request.concurrency):
+            yield json.dumps(with_download_urls(item), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@router.get("/queue")
+async def get_queue_status():
+    """查询截图排队状态：执行中和排队中的截图数、任务队列深度"""
+    return {
+        **admission_controller.stats(),
+        "pending_captures": capture_service.in_flight,
+        "job_queue_depth": job_service.queue_depth
+    }
+
+@router.get("/screenshots/{file_path:path}")
+async def download_screenshot(file_path: str, request: Request):
+    """
+    下载截图文件，支持Range请求断点续传和分段加载
+    
+    Args:
+        file_path: 相对于截图目录的文件路径
+    """
+    path = resolve_file(settings.screenshot_dir, file_path)
+    return await cached_file_response(path, request, settings.result_cache_max_age)
+
 @router.post("/test-long-screenshot")
 async def test_long_screenshot():
     """
@@ -138,7 +343,8 @@ async def test_long_screenshot():
                 )
         
         # 执行长截图
-        result = await playwright_service.take_long_screenshot(test_url)
+        async with admission_controller.slot(priority="interactive"):
+            result = await playwright_service.take_long_screenshot(test_url)
         
         return {
             "message": "测试长截图完成",
@@ -146,6 +352,8 @@ async def test_long_screenshot():
             "result": result
         }
         
+    except AdmissionRejectedError as e:
+        raise _too_many_requests(e)
     except Exception as e:
         logger.error(f"测试长截图时出错: {e}")
         raise HTTPException(
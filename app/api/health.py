@@ -0,0 +1,69 @@
+"""
+健康检查路由 - 存活检查和就绪检查，供负载均衡器摘除故障或过载的实例
+"""
+from typing import Dict, Any
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+from app.services.playwright_service import playwright_service
+from app.services.admission_service import admission_controller
+from app.services.job_service import job_service
+
+router = APIRouter(tags=["监控"])
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    检查实例是否可以接收新的截图请求
+
+    浏览器未连接或交互请求前面的排队数达到ready_queue_threshold时不就绪，
+    积压的批量请求和异步任务不影响就绪状态。
+
+    Returns:
+        就绪状态、不就绪的原因、浏览器状态、截图名额和最近一次截图耗时
+    """
+    browser = playwright_service.browser_status()
+    queue_depth = admission_controller.queue_depth_for("interactive")
+    threshold = settings.ready_queue_threshold
+    if threshold is None:
+        threshold = settings.capture_queue_size
+
+    reasons = []
+    if not browser["connected"]:
+        reasons.append("browser_disconnected")
+    if queue_depth >= threshold:
+        reasons.append("saturated")
+
+    return {
+        "status": "ready" if not reasons else "not_ready",
+        "reasons": reasons,
+        "browser": browser,
+        "captures": {
+            "busy": admission_controller.active,
+            "free": max(0, settings.max_inflight_captures - admission_controller.active),
+            "queue_depth": admission_controller.queue_depth,
+            "interactive_queue_depth": queue_depth,
+            "queue_threshold": threshold
+        },
+        "job_queue_depth": job_service.queue_depth,
+        "last_capture": playwright_service.last_capture
+    }
+
+
+@router.get("/health/live")
+async def liveness():
+    """存活检查：事件循环能够响应即为存活"""
+    return {"status": "alive"}
+
+
+@router.get("/health")
+@router.get("/health/ready")
+async def ready():
+    """就绪检查：不就绪时返回503，过载时附带Retry-After"""
+    report = readiness()
+    if report["status"] == "ready":
+        return report
+    headers = {}
+    if "saturated" in report["reasons"]:
+        headers["Retry-After"] = str(admission_controller.retry_after("interactive"))
+    return JSONResponse(status_code=503, content=report, headers=headers)
@@ -0,0 +1,37 @@
+"""
+Prometheus指标路由
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.services.playwright_service import playwright_service
+from app.services.admission_service import admission_controller
+from app.services.job_service import job_service
+from app.utils.metrics import (
+    BROWSER_OPEN_PAGES, BROWSER_CONTEXTS, CAPTURES_IN_FLIGHT, CAPTURE_QUEUE_DEPTH, JOB_QUEUE_DEPTH
+)
+
+router = APIRouter(tags=["监控"])
+
+
+def _browser_contexts() -> list:
+    """浏览器当前的上下文列表，浏览器未启动时为空"""
+    browser = playwright_service.browser
+    try:
+        return list(browser.contexts) if browser else []
+    except Exception:
+        return []
+
+
+# 仪表在采集时取值，始终反映当前状态
+BROWSER_CONTEXTS.set_function(lambda: len(_browser_contexts()))
+BROWSER_OPEN_PAGES.set_function(lambda: sum(len(context.pages) for context in _browser_contexts()))
+CAPTURES_IN_FLIGHT.set_function(lambda: admission_controller.active)
+CAPTURE_QUEUE_DEPTH.set_function(lambda: admission_controller.queue_depth)
+JOB_QUEUE_DEPTH.set_function(lambda: job_service.queue_depth)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """以Prometheus文本格式输出指标"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,22 @@
+"""
+截图结果静态文件路由
+"""
+from fastapi import APIRouter, Request
+from app.core.config import settings
+from app.utils.file_stream import cached_file_response, resolve_file
+
+router = APIRouter(prefix="/results", tags=["结果"])
+
+@router.get("/{file_path:path}")
+async def get_result_file(file_path: str, request: Request):
+    """
+    获取静态目录中的截图结果
+
+    文件名带有时间戳和截图ID，内容不会再变化，因此返回强ETag和长期缓存头，
+    CDN和客户端重复请求时通过If-None-Match得到304。
+    
+    Args:
+        file_path: 相对于静态目录的文件路径
+    """
+    path = resolve_file(settings.static_dir, file_path)
+    return await cached_file_response(path, request, settings.result_cache_max_age)
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List
 import os
 
 class Settings(BaseSettings):
@@ -16,15 +16,88 @@ class Settings(BaseSettings):
     screenshot_timeout: int = 30
     max_screenshot_height: int = 20000
     screenshot_quality: int = 95
+    max_screenshot_count: int = 20
+    # 滚动位置未前进且与上一帧平均像素差(0-255)不超过该值时视为重复帧并丢弃，负数表示不检测
+    duplicate_frame_threshold: float = 1.0
+    # 连续出现多少个重复帧后认为页面已停止滚动，提前结束截图
+    max_stalled_frames: int = 2
+    # 拼接时逐帧流式写出PNG，峰值内存与总高度无关
+    stream_png_output: bool = True
+    # 空白区域裁剪：连续纯色行达到blank_min_run时只保留blank_keep_rows行
+    blank_min_run: int = 300
+    blank_keep_rows: int = 60
+    blank_tolerance: int = 4
+    
+    # PNG编码配置：zlib压缩级别(0-9)、流式写出时的行过滤类型(none/sub/up)
+    png_compress_level: int = 6
+    png_filter: str = "none"
+    # 先以最低压缩级别快速输出，再在后台重新压缩替换
+    png_optimize_later: bool = False
+    # 同时进行的后台重新压缩数，其余排队等待
+    png_recompress_workers: int = 1
+    
+    # 准入控制配置：同时执行的截图数和排队容量，排队已满时返回429
+    max_inflight_captures: int = 3
+    capture_queue_size: int = 10
+    # 只留给interactive优先级请求的名额
+    reserved_interactive_slots: int = 1
+    # 排队数达到该值时就绪检查返回503，默认与capture_queue_size相同（即开始拒绝请求时）
+    ready_queue_threshold: Optional[int] = None
+    
+    # 截止时间配置（秒）：整体时限和各阶段时限，请求可以通过timeout和stage_timeouts覆盖
+    capture_timeout: float = 180.0
+    queue_timeout: float = 60.0
+    navigation_timeout: float = 45.0
+    preload_timeout: float = 30.0
+    frames_timeout: float = 120.0
+    stitch_timeout: float = 120.0
+    
+    # 任务队列配置
+    job_workers: int = 2
+    job_queue_size: int = 100
+    job_retention_seconds: int = 3600
+    
+    # 回调通知配置
+    webhook_timeout: float = 10.0
+    webhook_max_attempts: int = 5
+    webhook_backoff_base: float = 1.0
+    webhook_backoff_max: float = 60.0
+    webhook_max_connections: int = 20
+    
+    # 批量截图配置
+    batch_concurrency: int = 2
+    batch_max_urls: int = 500
     
     # 文件存储配置
+    # 截图输出目录位于静态目录下，生成的结果可以直接通过/results访问
+    screenshot_dir: str = "./static/screenshots"
     upload_dir: str = "./uploads"
     static_dir: str = "./static"
+    result_cache_max_age: int = 31536000
+    
+    # 结果缓存配置
+    cache_enabled: bool = True
+    cache_dir: str = "./static/cache"
+    # 索引包含缓存的URL和完整结果，必须放在静态目录之外，不能通过/results访问
+    cache_index_file: str = "./data/cache_index.json"
+    cache_ttl_seconds: int = 3600
+    cache_max_bytes: int = 1024 * 1024 * 1024
+    cache_resolve_timeout: float = 5.0
+    # 规范化URL时去掉的分享/追踪参数（utm_*始终去掉）
+    cache_ignored_params: List[str] = [
+        "share_token", "share_id", "u_code", "did", "iid", "timestamp", "ts",
+        "from", "from_ssr", "share_app_id", "sec_user_id", "utm_source"
+    ]
     
     # Chrome配置
     chrome_driver_path: Optional[str] = None
     headless: bool = True
     
+    # 追踪配置：none不追踪，json写入trace_file，otlp导出到collector（需要安装opentelemetry-sdk）
+    tracing_exporter: str = "none"
+    trace_file: str = "./logs/traces.jsonl"
+    otlp_endpoint: Optional[str] = None
+    
     # 日志配置
     log_level: str = "INFO"
     log_file: str = "./logs/app.log"
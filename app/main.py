@@ -3,8 +3,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
-from app.api import douyin
+from app.api import douyin, results, metrics, health
 from app.services.playwright_service import playwright_service
+from app.services.job_service import job_service
+from app.services.capture_service import capture_service
+from app.services.result_cache import result_cache
+from app.services.webhook_service import webhook_service
+from app.core.config import settings
+from app.utils.tracing import tracer
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -14,11 +20,18 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # 启动时初始化
     logger.info("正在启动抖音长截图服务...")
+    tracer.configure(settings.tracing_exporter, settings.trace_file, settings.otlp_endpoint)
     await playwright_service.initialize()
+    await job_service.start()
     yield
     # 关闭时清理
     logger.info("正在关闭抖音长截图服务...")
+    await job_service.stop()
+    await webhook_service.close()
     await playwright_service.close()
+    await capture_service.close()
+    await result_cache.close()
+    tracer.shutdown()
 
 app = FastAPI(
     title="抖音长截图服务",
@@ -38,15 +51,14 @@ app.add_middleware(
 
 # 包含路由
 app.include_router(douyin.router)
+app.include_router(results.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 @app.get("/")
 async def root():
     return {"message": "抖音长截图服务运行中"}
 
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,12 +1,65 @@
 """
 抖音相关的数据模型
 """
-from pydantic import BaseModel, HttpUrl
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, HttpUrl, Field
+import json
+from typing import Optional, Dict, Any, List, Literal
 
 class DouyinUrlRequest(BaseModel):
     """抖音链接请求模型"""
     url: HttpUrl
+
+# 不影响截图结果的选项，不参与缓存键
+CACHE_EXCLUDED_FIELDS = {"cache", "priority", "timeout", "stage_timeouts"}
+
+class LongScreenshotOptions(BaseModel):
+    """长截图选项"""
+    # 结果缓存策略：prefer优先使用缓存，bypass跳过缓存并刷新，only只读缓存
+    cache: Literal["prefer", "bypass", "only"] = "prefer"
+    # 调度优先级，默认同步接口为interactive、异步任务为normal、批量截图为bulk
+    priority: Optional[Literal["interactive", "normal", "bulk"]] = None
+    # 整体截止时间（秒），默认使用settings.capture_timeout
+    timeout: Optional[float] = Field(None, gt=0, le=3600)
+    # 各阶段时限（秒），覆盖配置中的默认值
+    stage_timeouts: Optional[Dict[Literal["queue", "navigation", "preload", "frames", "stitch"], float]] = None
+    # 输出格式，webp/avif超出尺寸限制时自动回退
+    output_format: Literal["png", "jpeg", "webp", "avif"] = "png"
+    # 有损编码质量，默认使用settings.screenshot_quality
+    quality: Optional[int] = Field(default=None, ge=1, le=100)
+    # WebP/AVIF无损编码
+    lossless: bool = False
+    # 编码耗时档位(0-6)，越大压缩率越高、编码越慢
+    effort: int = Field(default=4, ge=0, le=6)
+    # PNG编码参数，未设置时使用全局配置
+    png_compress_level: Optional[int] = Field(default=None, ge=0, le=9)
+    png_filter: Optional[Literal["none", "sub", "up"]] = None
+    png_optimize_later: Optional[bool] = None
+    # 折叠拼接结果中的大段空白（纯色）区域
+    trim_blank: bool = False
+    # 额外输出DZI瓦片金字塔，便于客户端按需加载可见区域
+    tiles: bool = False
+    tile_size: int = Field(default=256, ge=64, le=2048)
+    tile_overlap: int = Field(default=1, ge=0, le=8)
+    tile_format: Literal["jpeg", "png", "webp"] = "jpeg"
+    # 拼接时同步生成缩略图（固定宽度）和预览图（顶部指定高度），未设置则不生成
+    thumbnail_width: Optional[int] = Field(default=None, ge=16, le=2048)
+    preview_height: Optional[int] = Field(default=None, ge=16, le=20000)
+    thumbnail_format: Literal["jpeg", "png", "webp"] = "jpeg"
+    
+    def cache_key(self) -> str:
+        """影响截图结果的选项序列化，子类增加的字段（如url）不计入"""
+        fields = set(LongScreenshotOptions.model_fields) - CACHE_EXCLUDED_FIELDS
+        return json.dumps(self.model_dump(include=fields), sort_keys=True)
+
+class LongScreenshotRequest(LongScreenshotOptions):
+    """长截图请求模型"""
+    url: HttpUrl
+    # 直接在响应中返回图片内容，而不是JSON结果
+    return_image: bool = False
+    # 异步任务完成后POST结果的回调地址
+    callback_url: Optional[HttpUrl] = None
+    # 回调时以multipart形式附带截图文件
+    callback_include_image: bool = False
     
 class DouyinPageResponse(BaseModel):
     """抖音页面响应模型"""
@@ -29,3 +82,29 @@ class ScreenshotResponse(BaseModel):
     message: str
     screenshot_path: Optional[str] = None
     error: Optional[str] = None
+
+class BatchScreenshotRequest(LongScreenshotOptions):
+    """批量长截图请求模型，所有URL共享同一组选项"""
+    urls: List[HttpUrl] = Field(min_length=1)
+    # 并发上限，默认使用settings.batch_concurrency
+    concurrency: Optional[int] = Field(default=None, ge=1, le=32)
+
+class JobSubmitResponse(BaseModel):
+    """长截图任务提交响应模型"""
+    job_id: str
+    status: str
+    status_url: str
+    result_url: str
+
+class JobStatusResponse(BaseModel):
+    """长截图任务状态响应模型"""
+    job_id: str
+    url: str
+    status: str
+    progress: Dict[str, Any] = {}
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # 回调投递状态：status(pending/delivered/failed)、attempts、last_error
+    callback: Optional[Dict[str, Any]] = None
@@ -0,0 +1,215 @@
+"""
+准入控制模块 - 限制同时执行的截图数量，按优先级调度排队请求，超出排队容量时快速拒绝
+"""
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List
+import itertools
+import asyncio
+import logging
+import math
+import time
+from app.core.config import settings
+from app.utils.metrics import ADMISSION_REJECTED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# 还没有截图耗时数据时用于估算Retry-After的耗时（秒）
+DEFAULT_CAPTURE_SECONDS = 30.0
+
+# 优先级从高到低：用户交互请求、普通请求（异步任务）、批量请求
+PRIORITY_CLASSES = ("interactive", "normal", "bulk")
+
+
+class AdmissionRejectedError(Exception):
+    """排队已满，拒绝新的截图请求"""
+
+    def __init__(self, message: str, retry_after: int, queue_depth: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+
+
+class AdmissionTicket:
+    """一次准入许可，获得执行名额前在队列中等待"""
+
+    def __init__(self, controller: "AdmissionController", priority: str, sequence: int):
+        self._controller = controller
+        self.priority = priority
+        self.sequence = sequence
+        self._future: Optional[asyncio.Future] = None
+        self._released = False
+        self.granted = False
+        self.started_at: Optional[float] = None
+
+    async def wait(self):
+        """等待执行名额"""
+        if not self.granted:
+            await asyncio.shield(self._future)
+
+    def promote(self, priority: str):
+        """提升排队中的优先级（例如交互请求合并到批量请求的截图上）"""
+        self._controller._promote(self, priority)
+
+    def release(self):
+        """归还名额或退出队列，可重复调用"""
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    截图准入控制器
+
+    同时执行的截图不超过max_inflight_captures，其余排队，按优先级、同级按到达顺序获得名额；
+    其中reserved_interactive_slots个名额只留给interactive请求，保证批量流量占满时用户请求仍能立即执行。
+    排在新请求前面（同级和更高优先级）的排队数达到capture_queue_size时新请求直接被拒绝，
+    并根据平均耗时估算重试等待时间；积压的低优先级请求不会导致高优先级请求被拒绝。
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.rejected = 0
+        self._active_by_class: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._waiters: List[AdmissionTicket] = []
+        self._sequence = itertools.count()
+        self._avg_duration: Optional[float] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """排队等待执行的请求数"""
+        return len(self._waiters)
+
+    def queue_depth_for(self, priority: str) -> int:
+        """排在该优先级请求前面的排队数（同级和更高优先级），更低优先级的排队不影响它"""
+        rank = PRIORITY_CLASSES.index(priority)
+        return sum(1 for waiter in self._waiters if PRIORITY_CLASSES.index(waiter.priority) <= rank)
+
+    def retry_after(self, priority: Optional[str] = None) -> int:
+        """估算排队清空所需的秒数，指定优先级时只计算排在它前面的请求"""
+        duration = self._avg_duration or DEFAULT_CAPTURE_SECONDS
+        queued = self.queue_depth if priority is None else self.queue_depth_for(priority)
+        pending = self.active + queued
+        return max(1, math.ceil(duration * pending / max(1, settings.max_inflight_captures)))
+
+    def _can_run(self, priority: str) -> bool:
+        """当前是否有该优先级可用的空闲名额"""
+        if self.active >= settings.max_inflight_captures:
+            return False
+        if priority == PRIORITY_CLASSES[0]:
+            return True
+        shared_slots = max(1, settings.max_inflight_captures - settings.reserved_interactive_slots)
+        return self.active - self._active_by_class[PRIORITY_CLASSES[0]] < shared_slots
+
+    def admit(self, wait: bool = False, priority: str = "normal") -> AdmissionTicket:
+        """
+        申请执行名额，立即占位（有空闲名额时直接获得，否则进入队列）
+
+        Args:
+            wait: 排队已满时仍然排队而不是拒绝，用于自身已经限流的任务队列和批量截图
+            priority: 优先级，interactive/normal/bulk
+
+        Returns:
+            准入许可，调用方先await ticket.wait()，结束后调用ticket.release()
+
+        Raises:
+            AdmissionRejectedError: 排队已满
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知的优先级: {priority}")
+        ticket = AdmissionTicket(self, priority, next(self._sequence))
+        if self._can_run(priority) and not any(self._outranks(waiter, ticket) for waiter in self._waiters):
+            self._grant(ticket)
+            return ticket
+        queue_depth = self.queue_depth_for(priority)
+        if not wait and queue_depth >= settings.capture_queue_size:
+            self.rejected += 1
+            ADMISSION_REJECTED_TOTAL.inc()
+            retry_after = self.retry_after(priority)
+            logger.warning(f"截图排队已满({queue_depth})，拒绝{priority}请求，建议 {retry_after} 秒后重试")
+            raise AdmissionRejectedError(
+                f"服务繁忙，排队已满({settings.capture_queue_size})",
+                retry_after=retry_after,
+                queue_depth=queue_depth
+            )
+        ticket._future = asyncio.get_running_loop().create_future()
+        self._waiters.append(ticket)
+        return ticket
+
+    @asynccontextmanager
+    async def slot(self, wait: bool = False, priority: str = "normal"):
+        """在获得执行名额后执行代码块，结束时归还名额"""
+        ticket = self.admit(wait, priority)
+        try:
+            await ticket.wait()
+            yield
+        finally:
+            ticket.release()
+
+    @staticmethod
+    def _outranks(a: AdmissionTicket, b: AdmissionTicket) -> bool:
+        """a的优先级不低于b（同级时先到先得）"""
+        return PRIORITY_CLASSES.index(a.priority) <= PRIORITY_CLASSES.index(b.priority)
+
+    def _grant(self, ticket: AdmissionTicket):
+        self.active += 1
+        self._active_by_class[ticket.priority] += 1
+        ticket.granted = True
+        ticket.started_at = time.monotonic()
+        if ticket._future is not None and not ticket._future.done():
+            ticket._future.set_result(None)
+
+    def _release(self, ticket: AdmissionTicket):
+        if not ticket.granted:
+            # 还在排队时取消
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+            if ticket._future is not None and not ticket._future.done():
+                ticket._future.cancel()
+            return
+
+        self.active -= 1
+        self._active_by_class[ticket.priority] -= 1
+        duration = time.monotonic() - ticket.started_at
+        # 指数加权平均，平滑单次异常耗时
+        self._avg_duration = duration if self._avg_duration is None else 0.8 * self._avg_duration + 0.2 * duration
+        self._schedule()
+
+    def _promote(self, ticket: AdmissionTicket, priority: str):
+        if ticket.granted or ticket._released:
+            return
+        if PRIORITY_CLASSES.index(priority) < PRIORITY_CLASSES.index(ticket.priority):
+            ticket.priority = priority
+            self._schedule()
+
+    def _schedule(self):
+        """按优先级依次为排队请求分配空闲名额"""
+        self._waiters.sort(key=lambda waiter: (PRIORITY_CLASSES.index(waiter.priority), waiter.sequence))
+        index = 0
+        while index < len(self._waiters) and self.active < settings.max_inflight_captures:
+            waiter = self._waiters[index]
+            if self._can_run(waiter.priority):
+                self._grant(self._waiters.pop(index))
+            else:
+                index += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """准入状态"""
+        return {
+            "in_flight": self.active,
+            "queue_depth": self.queue_depth,
+            "max_in_flight": settings.max_inflight_captures,
+            "max_queue": settings.capture_queue_size,
+            "reserved_interactive_slots": settings.reserved_interactive_slots,
+            "in_flight_by_priority": dict(self._active_by_class),
+            "queued_by_priority": {
+                priority: sum(1 for waiter in self._waiters if waiter.priority == priority)
+                for priority in PRIORITY_CLASSES
+            },
+            "rejected": self.rejected,
+            "avg_capture_seconds": round(self._avg_duration, 3) if self._avg_duration is not None else None
+        }
+
+# 全局服务实例
+admission_controller = AdmissionController()
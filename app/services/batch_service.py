@@ -0,0 +1,62 @@
+"""
+批量长截图模块 - 在并发上限内调度多个URL，按完成顺序产出结果
+"""
+from typing import Optional, Dict, Any, List, AsyncIterator
+import asyncio
+import logging
+from app.core.config import settings
+from app.models.douyin import LongScreenshotOptions
+from app.services.capture_service import capture_service
+
+logger = logging.getLogger(__name__)
+
+
+class BatchService:
+    async def run(self, urls: List[str], options: Optional[LongScreenshotOptions] = None,
+                  concurrency: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        批量执行长截图
+
+        所有URL共享同一组选项，同时进行的截图数不超过concurrency。
+        迭代提前结束（例如客户端断开）时，未完成的截图会被取消。
+
+        Args:
+            urls: 抖音页面URL列表
+            options: 长截图选项
+            concurrency: 并发上限，默认使用settings.batch_concurrency
+
+        Yields:
+            每个URL的截图结果，附带其在请求中的序号
+        """
+        concurrency = max(1, min(concurrency or settings.batch_concurrency, len(urls)))
+        semaphore = asyncio.Semaphore(concurrency)
+        logger.info(f"开始批量长截图: {len(urls)} 个URL, 并发 {concurrency}")
+
+        async def capture(index: int, url: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await capture_service.capture(url, options, wait=True, priority="bulk")
+                except Exception as e:
+                    logger.error(f"批量长截图第 {index + 1} 个URL出错: {e}")
+                    result = {"success": False, "error": str(e), "original_url": url}
+            return {"index": index, "url": url, **result}
+
+        tasks = [asyncio.create_task(capture(index, url)) for index, url in enumerate(urls)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                if item.get("success"):
+                    succeeded += 1
+                yield item
+        finally:
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.info(f"批量长截图提前结束，已取消 {len(pending)} 个未完成的截图")
+            logger.info(f"批量长截图结束: 成功 {succeeded}/{len(urls)}")
+
+# 全局服务实例
+batch_service = BatchService()
@@ -0,0 +1,204 @@
+"""
+截图调度模块 - API、任务队列和批量截图的统一入口，负责结果缓存、请求合并等跨请求逻辑
+"""
+from typing import Optional, Dict, Any, Callable, List
+import asyncio
+import logging
+from app.core.config import settings
+from app.models.douyin import LongScreenshotOptions
+from app.services.playwright_service import playwright_service
+from app.services.admission_service import admission_controller, AdmissionTicket
+from app.services.result_cache import result_cache, canonicalize_url
+from app.utils.deadline import Deadline, CaptureTimeoutError
+from app.utils.metrics import CACHE_LOOKUPS_TOTAL, StageTimer
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次正在进行的截图，等待同一结果的请求共享它"""
+
+    def __init__(self, ticket: AdmissionTicket):
+        self.ticket = ticket
+        self.task: Optional[asyncio.Task] = None
+        self.callbacks: List[Callable[[Dict[str, Any]], Any]] = []
+        self.waiters = 0
+
+    async def report(self, event: Dict[str, Any]):
+        """将进度事件转发给所有等待者"""
+        for callback in list(self.callbacks):
+            await playwright_service._report_progress(callback, **event)
+
+
+class CaptureService:
+    def __init__(self):
+        # 缓存键 -> 正在进行的截图
+        self._flights: Dict[str, _Flight] = {}
+        # 等待后台压缩完成后更新缓存的任务
+        self._background_tasks = set()
+
+    async def close(self):
+        """等待后台的缓存更新完成"""
+        if self._background_tasks:
+            logger.info(f"等待 {len(self._background_tasks)} 个后台缓存更新完成...")
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    @property
+    def in_flight(self) -> int:
+        """正在进行的截图数（合并后）"""
+        return len(self._flights)
+
+    async def capture(self, url: str, options: Optional[LongScreenshotOptions] = None,
+                      progress_callback: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                      wait: bool = False, priority: str = "normal") -> Dict[str, Any]:
+        """
+        执行长截图，按options.cache使用结果缓存
+
+        - prefer: 命中缓存直接返回，未命中时截图并写入缓存
+        - bypass: 不读缓存，截图后刷新缓存
+        - only: 只读缓存，未命中时返回失败结果
+
+        同一URL和输出选项的并发请求只执行一次截图，所有请求共享其结果（coalesced为True）。
+        需要新开截图时先经过准入控制，排队已满时抛出AdmissionRejectedError。
+        截止时间从调用时开始计算（包括排队时间），合并的请求共享第一个请求的截止时间；
+        所有等待者都被取消（例如客户端断开连接）时，截图随之取消。
+
+        Args:
+            url: 抖音页面URL
+            options: 长截图选项
+            progress_callback: 进度回调
+            wait: 排队已满时继续排队而不是拒绝
+            priority: options.priority未指定时使用的调度优先级
+
+        Returns:
+            截图结果，cache字段标明hit/miss/bypass
+
+        Raises:
+            AdmissionRejectedError: 排队已满
+        """
+        options = options or LongScreenshotOptions()
+        priority = options.priority or priority
+        deadline = playwright_service.create_deadline(options)
+        use_cache = settings.cache_enabled
+        if use_cache:
+            canonical_url = await result_cache.resolve_url(url)
+        else:
+            canonical_url = canonicalize_url(url)
+        key = result_cache.make_key(canonical_url, options.cache_key())
+
+        if use_cache and options.cache != "bypass":
+            cached = result_cache.get(key)
+            CACHE_LOOKUPS_TOTAL.labels("miss" if cached is None else "hit").inc()
+            if cached is not None:
+                logger.info(f"命中结果缓存: {url}")
+                return {**cached, "original_url": url, "cache": "hit"}
+
+        if options.cache == "only":
+            return {
+                "success": False,
+                "error": "缓存未命中",
+                "original_url": url,
+                "cache": "miss"
+            }
+
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if coalesced:
+            logger.info(f"合并到正在进行的截图: {url}")
+            # 高优先级请求等待低优先级的截图时，提升其排队优先级
+            flight.ticket.promote(priority)
+        else:
+            ticket = admission_controller.admit(wait, priority)
+            flight = _Flight(ticket)
+            flight.task = asyncio.create_task(self._run(url, key, options, flight, ticket, deadline))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish_flight(key, flight, ticket))
+
+        if progress_callback:
+            flight.callbacks.append(progress_callback)
+        flight.waiters += 1
+        try:
+            # 等待者被取消时不影响共享的截图任务
+            result = dict(await asyncio.shield(flight.task))
+        finally:
+            flight.waiters -= 1
+            if progress_callback in flight.callbacks:
+                flight.callbacks.remove(progress_callback)
+            if flight.waiters == 0 and not flight.task.done():
+                # 没有人再等待结果，停止截图释放浏览器资源
+                logger.info(f"所有请求都已取消，停止截图: {url}")
+                flight.task.cancel()
+
+        result["original_url"] = url
+        if use_cache:
+            result["cache"] = "bypass" if options.cache == "bypass" else "miss"
+        if coalesced:
+            result["coalesced"] = True
+        return result
+
+    def _finish_flight(self, key: str, flight: _Flight, ticket: AdmissionTicket):
+        """截图结束后归还名额并移除记录，之后的请求走缓存或重新截图"""
+        ticket.release()
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled() and flight.task.exception() and not flight.waiters:
+            logger.error(f"截图任务出错且无等待者: {flight.task.exception()}")
+
+    async def _run(self, url: str, key: str, options: LongScreenshotOptions, flight: _Flight,
+                   ticket: AdmissionTicket, deadline: Deadline) -> Dict[str, Any]:
+        """获得执行名额后实际执行截图并写入缓存"""
+        # 排队耗时记入queue阶段，排队超时的截图同样计入截图次数
+        timer = StageTimer()
+        try:
+            with timer.stage("queue"):
+                await deadline.run("queue", ticket.wait())
+        except CaptureTimeoutError as e:
+            timer.finish("timeout", e)
+            logger.warning(f"排队超时: {url}, {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "timeout": True,
+                "stage": e.stage,
+                "original_url": url,
+                "timings": timer.timings()
+            }
+
+        # 确保浏览器已初始化
+        if not playwright_service.browser:
+            if not await playwright_service.initialize():
+                raise Exception("浏览器初始化失败")
+
+        result = await playwright_service.take_long_screenshot(
+            url, options=options, progress_callback=flight.report, deadline=deadline
+        )
+        if settings.cache_enabled and result.get("success"):
+            try:
+                if result.get("current_url"):
+                    # 之后的请求按浏览器到达的最终地址计算缓存键，结果也要存在该键下
+                    result_cache.remember_url(url, result["current_url"])
+                    key = result_cache.make_key(canonicalize_url(result["current_url"]), options.cache_key())
+                cached = await result_cache.put(key, result)
+                if result.get("optimizing"):
+                    # 后台压缩会原子替换原文件，压缩完成后再把新文件移动到缓存中
+                    self._finish_when_recompressed(key, result["output_path"])
+                result = cached
+            except Exception as e:
+                logger.error(f"写入结果缓存失败: {e}")
+        return result
+
+    def _finish_when_recompressed(self, key: str, source_path: str):
+        """在后台等待PNG重新压缩完成后更新缓存中的文件"""
+        async def finish():
+            try:
+                await playwright_service.wait_recompressed(source_path)
+                await result_cache.finish_optimizing(key, source_path)
+            except Exception as e:
+                logger.error(f"更新缓存中的压缩结果失败: {e}")
+
+        task = asyncio.create_task(finish())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+# 全局服务实例
+capture_service = CaptureService()
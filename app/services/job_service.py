@@ -0,0 +1,220 @@
+"""
+长截图任务队列模块 - 提交后立即返回任务ID，由固定数量的后台worker执行截图
+"""
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List
+import asyncio
+import logging
+import time
+import uuid
+from app.core.config import settings
+from app.models.douyin import LongScreenshotOptions
+from app.services.capture_service import capture_service
+from app.services.webhook_service import webhook_service
+from app.utils.file_stream import with_download_urls
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+
+@dataclass
+class CaptureJob:
+    """长截图任务"""
+    id: str
+    url: str
+    options: LongScreenshotOptions
+    status: str = "queued"
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    callback_url: Optional[str] = None
+    callback_include_image: bool = False
+    callback: Optional[Dict[str, Any]] = None
+    # 按发生顺序记录的事件，供SSE推送和断线重连
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def add_event(self, stage: str, **data):
+        """记录事件并唤醒等待中的订阅者"""
+        self.events.append({"stage": stage, **data, "time": time.time()})
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_event(self, index: int, timeout: float) -> bool:
+        """
+        等待第index个事件出现
+
+        Returns:
+            超时前是否有新事件
+        """
+        changed = self._changed
+        if len(self.events) > index:
+            return True
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        """任务状态（不含结果）"""
+        return {
+            "job_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "callback": self.callback
+        }
+
+
+class JobService:
+    def __init__(self):
+        self.jobs: Dict[str, CaptureJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def queue_depth(self) -> int:
+        """排队中的任务数"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """启动worker"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.job_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(index))
+            for index in range(settings.job_workers)
+        ]
+        logger.info(f"长截图任务队列已启动: {settings.job_workers} 个worker, 队列容量 {settings.job_queue_size}")
+
+    async def stop(self):
+        """停止worker，未执行的任务保持排队状态"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("长截图任务队列已停止")
+
+    def submit(self, url: str, options: Optional[LongScreenshotOptions] = None,
+               callback_url: Optional[str] = None, callback_include_image: bool = False) -> CaptureJob:
+        """
+        提交长截图任务
+
+        Args:
+            url: 抖音页面URL
+            options: 长截图选项
+            callback_url: 任务结束后POST结果的回调地址
+            callback_include_image: 回调时附带截图文件
+
+        Returns:
+            新建的任务
+
+        Raises:
+            JobQueueFullError: 队列已满
+        """
+        if self._queue is None:
+            raise RuntimeError("任务队列未启动，请先调用start方法")
+        self._prune()
+        job = CaptureJob(
+            id=uuid.uuid4().hex,
+            url=url,
+            options=options or LongScreenshotOptions(),
+            callback_url=callback_url,
+            callback_include_image=callback_include_image
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"任务队列已满({settings.job_queue_size})")
+        self.jobs[job.id] = job
+        job.add_event("queued")
+        logger.info(f"已提交长截图任务 {job.id}: {url}")
+        return job
+
+    def get(self, job_id: str) -> Optional[CaptureJob]:
+        """查询任务"""
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        """清理超过保留时间的已完成任务"""
+        expire_before = time.time() - settings.job_retention_seconds
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished and job.finished_at < expire_before
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self, index: int):
+        """从队列中取出任务并执行"""
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: CaptureJob):
+        """执行单个任务"""
+        job.status = "running"
+        job.started_at = time.time()
+        logger.info(f"开始执行长截图任务 {job.id}")
+        job.add_event("running")
+
+        def on_progress(event: Dict[str, Any]):
+            job.progress = event
+            job.add_event(**event)
+
+        try:
+            result = await capture_service.capture(
+                job.url, job.options, progress_callback=on_progress, wait=True
+            )
+            if result.get("success"):
+                job.result = result
+                job.status = "succeeded"
+            else:
+                job.error = result.get("error", "未知错误")
+                job.status = "failed"
+        except Exception as e:
+            logger.error(f"长截图任务 {job.id} 执行出错: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.add_event(job.status, error=job.error)
+            logger.info(f"长截图任务 {job.id} 结束: {job.status}")
+            if job.callback_url:
+                self._notify(job)
+
+    def _notify(self, job: CaptureJob):
+        """在后台向回调地址发送任务结果"""
+        payload = {
+            "event": f"job.{job.status}",
+            **job.to_dict(),
+            "result": with_download_urls(dict(job.result)) if job.result else None
+        }
+        payload.pop("callback")
+        image_path = None
+        if job.callback_include_image and job.result and not job.result.get("segments"):
+            image_path = job.result.get("output_path")
+        job.callback = {"status": "pending"}
+        webhook_service.schedule(job.callback_url, payload, image_path, status=job.callback)
+
+# 全局服务实例
+job_service = JobService()
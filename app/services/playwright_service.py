@@ -2,20 +2,51 @@
 Playwright服务模块 - 用于处理网页截图和操作
 """
 from playwright.async_api import async_playwright, Browser, Page, BrowserContext
-from typing import Optional, Dict, Any, List
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from typing import Optional, Dict, Any, List, Tuple, Callable
 import asyncio
+import inspect
 import logging
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager
 from datetime import datetime
 from PIL import Image
 from app.core.config import settings
+from app.models.douyin import LongScreenshotOptions
+from app.utils.image_writer import (
+    StreamingPNGWriter, CanvasImageWriter, ThumbnailWriter, PreviewWriter, OptionalOutputWriter,
+    FILE_EXTENSIONS, resolve_output_format, build_save_params, recompress_png
+)
+from app.utils.tile_pyramid import TilePyramidWriter
+from app.utils.frame_hash import frame_fingerprint, frame_difference
+from app.utils.blank_trim import BlankRowTrimmer
+from app.utils.deadline import Deadline, CaptureTimeoutError
+from app.utils.metrics import StageTimer
+from app.utils.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+
+class StitchCancelledError(Exception):
+    """拼接在完成前被取消（例如拼接阶段超时），线程池中的拼接随之停止"""
+
+
 class PlaywrightService:
     def __init__(self):
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
+        # 最近一次长截图的结果和耗时，供就绪检查使用
+        self.last_capture: Optional[Dict[str, Any]] = None
+        # 后台PNG重新压缩任务
+        self._background_tasks = set()
+        # 文件路径 -> 正在进行的重新压缩任务
+        self._recompress_tasks: Dict[str, asyncio.Task] = {}
+        # 后台重新压缩专用线程池，限制同时进行的压缩数
+        self._recompress_executor: Optional[ThreadPoolExecutor] = None
         
     async def initialize(self):
         """初始化Playwright浏览器"""
@@ -64,6 +95,12 @@ class PlaywrightService:
     
     async def close(self):
         """关闭浏览器"""
+        if self._background_tasks:
+            logger.info(f"等待 {len(self._background_tasks)} 个后台压缩任务完成...")
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        if self._recompress_executor:
+            self._recompress_executor.shutdown(wait=False)
+            self._recompress_executor = None
         try:
             if self.context:
                 await self.context.close()
@@ -73,6 +110,25 @@ class PlaywrightService:
         except Exception as e:
             logger.error(f"关闭浏览器时出错: {e}")
     
+    def browser_status(self) -> Dict[str, Any]:
+        """
+        浏览器状态
+        
+        Returns:
+            是否已连接、上下文数和打开的页面数
+        """
+        try:
+            connected = self.browser is not None and self.browser.is_connected()
+            contexts = list(self.browser.contexts) if connected else []
+            return {
+                "connected": connected and self.context is not None,
+                "contexts": len(contexts),
+                "open_pages": sum(len(context.pages) for context in contexts)
+            }
+        except Exception as e:
+            logger.warning(f"查询浏览器状态失败: {e}")
+            return {"connected": False, "contexts": 0, "open_pages": 0}
+    
     async def open_douyin_url(self, url: str) -> Dict[str, Any]:
         """
         打开抖音链接并获取页面信息
@@ -86,6 +142,7 @@ class PlaywrightService:
         if not self.context:
             raise Exception("浏览器未初始化，请先调用initialize方法")
         
+        span = tracer.start_span("douyin.open_douyin_url", url=url)
         try:
             page = await self.context.new_page()
             
@@ -148,6 +205,7 @@ class PlaywrightService:
             }
             
             logger.info(f"页面加载成功: {title}")
+            span.set_attributes({"current_url": current_url, "status_code": page_info["status_code"]})
             
             # 暂时不关闭页面，保持打开状态以便后续操作
             # await page.close()
@@ -156,11 +214,14 @@ class PlaywrightService:
             
         except Exception as e:
             logger.error(f"打开链接失败: {e}")
+            span.record_error(e)
             return {
                 "original_url": url,
                 "error": str(e),
                 "success": False
             }
+        finally:
+            span.end()
     
     async def take_screenshot(self, page: Page, full_page: bool = True) -> bytes:
         """
@@ -183,13 +244,22 @@ class PlaywrightService:
             logger.error(f"截图失败: {e}")
             raise
     
-    async def take_long_screenshot(self, url: str, output_dir: str = "screenshots") -> Dict[str, Any]:
+    async def take_long_screenshot(self, url: str, output_dir: Optional[str] = None,
+                                   options: Optional[LongScreenshotOptions] = None,
+                                   progress_callback: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                                   deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         对抖音页面进行长截图
         
+        打开页面、触发懒加载、逐帧截图和拼接各阶段都受截止时间限制，超时时返回timeout为True的失败结果；
+        任务被取消（例如客户端断开连接）时立即停止。无论成功与否，页面都会被关闭。
+        
         Args:
             url: 抖音页面URL
-            output_dir: 输出目录
+            output_dir: 输出目录，默认使用settings.screenshot_dir
+            options: 长截图选项（输出格式、质量等），默认输出PNG
+            progress_callback: 进度回调，接收包含stage字段的事件字典，可以是协程函数
+            deadline: 截止时间，默认按options和配置创建
             
         Returns:
             长截图结果信息
@@ -197,12 +267,28 @@ class PlaywrightService:
         if not self.context:
             raise Exception("浏览器未初始化，请先调用initialize方法")
         
+        options = options or LongScreenshotOptions()
+        output_dir = output_dir or settings.screenshot_dir
+        deadline = deadline or self.create_deadline(options)
+        # 每次截图使用独立的文件名前缀，避免并发任务的截图文件互相覆盖
+        capture_id = uuid.uuid4().hex[:8]
+        timer = StageTimer("douyin.take_long_screenshot", url=url, capture_id=capture_id)
+        outcome = "failure"
+        error = None
+        # 附加到整体span的结果属性
+        span_attributes: Dict[str, Any] = {}
+        page = None
+        
+        async def report(stage: str, **data):
+            await self._report_progress(progress_callback, stage, **data)
+        
         try:
             # 确保输出目录存在
             os.makedirs(output_dir, exist_ok=True)
             
             # 创建页面
             page = await self.context.new_page()
+            self._track_network(page, timer)
             
             # 添加移动端模拟脚本
             await page.add_init_script("""
@@ -239,75 +325,83 @@ class PlaywrightService:
             page.set_default_timeout(settings.screenshot_timeout * 1000)
             
             logger.info(f"正在访问长截图URL: {url}")
+            await report("navigating", url=url)
             
-            # 打开页面
-            response = await page.goto(url, wait_until='networkidle')
-            await page.wait_for_load_state('networkidle')
+            async with self._page_stage(page, deadline, "navigation"), timer.stage("navigation") as navigation:
+                # 打开页面
+                response = await page.goto(url, wait_until='networkidle')
+                await page.wait_for_load_state('networkidle')
+                navigation.set_attribute("final_url", page.url)
+                if response:
+                    navigation.set_attribute("status_code", response.status)
+                    navigation.set_attribute("redirects", self._count_redirects(response))
+            
+            async with self._page_stage(page, deadline, "preload"), timer.stage("preload"):
+                # 等待页面完全加载，包括动态内容（与成功脚本保持一致）
+                await timer.wait(3)
+            
+                # 尝试滚动触发懒加载 - 使用多种方式，针对正确的滚动容器
+                logger.info("尝试触发懒加载...")
+                await report("preloading")
             
-            # 等待页面完全加载，包括动态内容（与成功脚本保持一致）
-            await asyncio.sleep(3)
-            
-            # 尝试滚动触发懒加载 - 使用多种方式，针对正确的滚动容器
-            logger.info("尝试触发懒加载...")
-            
-            # 方法1: 使用JavaScript滚动容器
-            await page.evaluate("""
-                () => {
-                    const scrollContainer = document.querySelector('.detail-container__body') || 
-                                          document.querySelector('#container') ||
-                                          document.body;
-                    scrollContainer.scrollTop = scrollContainer.scrollHeight;
-                    if (scrollContainer === document.body) {
-                        window.scrollTo(0, document.body.scrollHeight);
+                # 方法1: 使用JavaScript滚动容器
+                await page.evaluate("""
+                    () => {
+                        const scrollContainer = document.querySelector('.detail-container__body') || 
+                                              document.querySelector('#container') ||
+                                              document.body;
+                        scrollContainer.scrollTop = scrollContainer.scrollHeight;
+                        if (scrollContainer === document.body) {
+                            window.scrollTo(0, document.body.scrollHeight);
+                        }
                     }
-                }
-            """)
-            await asyncio.sleep(1)
-            
-            # 方法2: 使用键盘事件
-            await page.keyboard.press("End")
-            await asyncio.sleep(1)
-            
-            # 回到顶部
-            await page.evaluate("""
-                () => {
-                    const scrollContainer = document.querySelector('.detail-container__body') || 
-                                          document.querySelector('#container') ||
-                                          document.body;
-                    scrollContainer.scrollTop = 0;
-                    if (scrollContainer === document.body) {
-                        window.scrollTo(0, 0);
+                """)
+                await timer.wait(1)
+            
+                # 方法2: 使用键盘事件
+                await page.keyboard.press("End")
+                await timer.wait(1)
+            
+                # 回到顶部
+                await page.evaluate("""
+                    () => {
+                        const scrollContainer = document.querySelector('.detail-container__body') || 
+                                              document.querySelector('#container') ||
+                                              document.body;
+                        scrollContainer.scrollTop = 0;
+                        if (scrollContainer === document.body) {
+                            window.scrollTo(0, 0);
+                        }
                     }
-                }
-            """)
-            await page.keyboard.press("Home")
-            await asyncio.sleep(1)
-            
-            # 查找主要的滚动容器并获取页面尺寸
-            viewport_size = await page.evaluate("""
-                () => {
-                    // 查找主要的滚动容器
-                    const scrollContainer = document.querySelector('.detail-container__body') || 
-                                          document.querySelector('#container') ||
-                                          document.body;
+                """)
+                await page.keyboard.press("Home")
+                await timer.wait(1)
+            
+                # 查找主要的滚动容器并获取页面尺寸
+                viewport_size = await page.evaluate("""
+                    () => {
+                        // 查找主要的滚动容器
+                        const scrollContainer = document.querySelector('.detail-container__body') || 
+                                              document.querySelector('#container') ||
+                                              document.body;
                     
-                    const body = document.body;
-                    const html = document.documentElement;
+                        const body = document.body;
+                        const html = document.documentElement;
                     
-                    return {
-                        width: window.innerWidth,
-                        height: window.innerHeight,
-                        scrollHeight: scrollContainer.scrollHeight,
-                        clientHeight: scrollContainer.clientHeight,
-                        scrollTop: scrollContainer.scrollTop,
-                        bodyScrollHeight: body.scrollHeight,
-                        documentScrollHeight: html.scrollHeight,
-                        devicePixelRatio: window.devicePixelRatio || 1,
-                        containerSelector: scrollContainer.className || scrollContainer.tagName,
-                        hasScrollContainer: scrollContainer !== body
-                    };
-                }
-            """)
+                        return {
+                            width: window.innerWidth,
+                            height: window.innerHeight,
+                            scrollHeight: scrollContainer.scrollHeight,
+                            clientHeight: scrollContainer.clientHeight,
+                            scrollTop: scrollContainer.scrollTop,
+                            bodyScrollHeight: body.scrollHeight,
+                            documentScrollHeight: html.scrollHeight,
+                            devicePixelRatio: window.devicePixelRatio || 1,
+                            containerSelector: scrollContainer.className || scrollContainer.tagName,
+                            hasScrollContainer: scrollContainer !== body
+                        };
+                    }
+                """)
             
             viewport_height = viewport_size['height']
             scroll_height = viewport_size['scrollHeight']
@@ -324,170 +418,218 @@ class PlaywrightService:
             if scroll_height <= viewport_height:
                 logger.info("页面无需滚动，执行单次截图")
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_path = os.path.join(output_dir, f"douyin_screenshot_{timestamp}.png")
-                await page.screenshot(path=output_path)
+                temp_screenshot_path = os.path.join(output_dir, f"debug_screenshot_{capture_id}.png")
+                async with timer.stage("frame"):
+                    await page.screenshot(path=temp_screenshot_path)
+                await report("frame", index=0, scroll=0, scroll_height=scroll_height, path=temp_screenshot_path)
+                output_path = os.path.join(output_dir, f"douyin_screenshot_{timestamp}_{capture_id}.png")
+                await report("stitching", frames=1)
+                stitch_result = await deadline.run(
+                    "stitch", self._stitch_screenshots([temp_screenshot_path], output_path, options=options,
+                                                       timer=timer)
+                )
                 
-                await page.close()
+                outcome = "success"
+                span_attributes = {"frames": 1, "bytes": stitch_result.get("file_size"),
+                                   "height": stitch_result.get("total_height")}
+                timer.resources["frame_count"] = 1
                 return {
                     "success": True,
-                    "output_path": output_path,
                     "screenshot_count": 1,
-                    "total_height": client_height,
-                    "file_size": os.path.getsize(output_path) if os.path.exists(output_path) else 0
+                    **stitch_result,
+                    "timings": timer.timings(),
+                    "resources": dict(timer.resources)
                 }
             
-            # 回到滚动容器顶部 - 使用多种方法确保滚动到顶部
-            logger.info("回到滚动容器顶部")
-            await page.evaluate("""
-                () => {
-                    const scrollContainer = document.querySelector('.detail-container__body') || 
-                                          document.querySelector('#container') ||
-                                          document.body;
-                    scrollContainer.scrollTop = 0;
-                    if (scrollContainer === document.body) {
-                        window.scrollTo({top: 0, behavior: 'smooth'});
+            async with self._page_stage(page, deadline, "frames"), timer.stage("frames"):
+                # 回到滚动容器顶部 - 使用多种方法确保滚动到顶部
+                logger.info("回到滚动容器顶部")
+                await page.evaluate("""
+                    () => {
+                        const scrollContainer = document.querySelector('.detail-container__body') || 
+                                              document.querySelector('#container') ||
+                                              document.body;
+                        scrollContainer.scrollTop = 0;
+                        if (scrollContainer === document.body) {
+                            window.scrollTo({top: 0, behavior: 'smooth'});
+                        }
                     }
-                }
-            """)
-            await asyncio.sleep(0.5)
-            await page.keyboard.press("Home")
-            await asyncio.sleep(0.5)
-            # 确认回到顶部
-            scroll_position = await page.evaluate("""
-                () => {
-                    const scrollContainer = document.querySelector('.detail-container__body') || 
-                                          document.querySelector('#container') ||
-                                          document.body;
-                    return scrollContainer.scrollTop;
-                }
-            """)
-            logger.info(f"当前滚动容器位置: {scroll_position}")
+                """)
+                await timer.wait(0.5)
+                await page.keyboard.press("Home")
+                await timer.wait(0.5)
+                # 确认回到顶部
+                scroll_position = await page.evaluate("""
+                    () => {
+                        const scrollContainer = document.querySelector('.detail-container__body') || 
+                                              document.querySelector('#container') ||
+                                              document.body;
+                        return scrollContainer.scrollTop;
+                    }
+                """)
+                logger.info(f"当前滚动容器位置: {scroll_position}")
             
-            # 长截图参数（最优配置）
-            scroll_step = 500  # 滚动距离
-            crop_bottom_pixels = 300  # 底部裁剪像素
+                # 长截图参数（最优配置）
+                scroll_step = 500  # 滚动距离
+                crop_bottom_pixels = 300  # 底部裁剪像素
             
-            logger.info(f"开始长截图: 滚动步长={scroll_step}px, 底部裁剪={crop_bottom_pixels}px")
+                logger.info(f"开始长截图: 滚动步长={scroll_step}px, 底部裁剪={crop_bottom_pixels}px")
             
-            # 执行长截图
-            screenshots = []
-            current_scroll = 0
-            screenshot_index = 0
-            max_scroll_height = scroll_height
+                # 执行长截图
+                screenshots = []
+                current_scroll = 0
+                screenshot_index = 0
+                max_scroll_height = scroll_height
+                # 重复帧检测：上一张保留帧的指纹、滚动位置和连续重复次数
+                previous_fingerprint = None
+                frame_scroll = scroll_position
+                kept_scroll = None
+                stalled_frames = 0
+                duplicate_frames = 0
             
-            while current_scroll < max_scroll_height:
-                logger.info(f"截图第 {screenshot_index + 1} 部分，当前滚动位置: {current_scroll}")
+                while current_scroll < max_scroll_height:
+                    logger.info(f"截图第 {screenshot_index + 1} 部分，当前滚动位置: {current_scroll}")
                 
-                # 等待页面稳定
-                await asyncio.sleep(0.8)
+                    # 等待页面稳定
+                    await timer.wait(0.8)
                 
-                # 截图当前视窗
-                temp_screenshot_path = os.path.join(output_dir, f"debug_screenshot_{screenshot_index:02d}_scroll_{current_scroll}.png")
-                await page.screenshot(path=temp_screenshot_path)
-                screenshots.append(temp_screenshot_path)
-                logger.info(f"保存截图: {temp_screenshot_path}")
+                    # 截图当前视窗
+                    temp_screenshot_path = os.path.join(
+                        output_dir, f"debug_screenshot_{capture_id}_{screenshot_index:02d}_scroll_{current_scroll}.png"
+                    )
+                    async with timer.stage("frame"):
+                        screenshot_bytes = await page.screenshot(path=temp_screenshot_path)
                 
-                # 计算下一次滚动位置
-                next_scroll = current_scroll + scroll_step
+                    # 与上一张保留帧比较，滚动停滞时页面内容不会变化
+                    is_duplicate = False
+                    if settings.duplicate_frame_threshold >= 0:
+                        # 解码整帧PNG较慢（3倍像素比约30ms），放到线程池中避免阻塞事件循环
+                        fingerprint = await asyncio.get_running_loop().run_in_executor(
+                            None, frame_fingerprint, screenshot_bytes
+                        )
+                        if previous_fingerprint is not None:
+                            difference = frame_difference(fingerprint, previous_fingerprint)
+                            # 页面确实滚动了但内容相同（例如大段重复背景）时仍保留该帧，只有滚动停滞才算重复
+                            is_duplicate = (difference <= settings.duplicate_frame_threshold
+                                            and frame_scroll <= kept_scroll)
+                        if not is_duplicate:
+                            previous_fingerprint = fingerprint
                 
-                # 滚动到下一个位置 - 使用容器滚动
-                if next_scroll >= max_scroll_height:
-                    # 滚动到底部
-                    logger.info("滚动到容器底部")
-                    await page.evaluate("""
-                        () => {
-                            const scrollContainer = document.querySelector('.detail-container__body') || 
-                                                  document.querySelector('#container') ||
-                                                  document.body;
-                            scrollContainer.scrollTop = scrollContainer.scrollHeight;
-                            if (scrollContainer === document.body) {
-                                window.scrollTo({top: document.body.scrollHeight, behavior: 'smooth'});
-                            }
-                        }
-                    """)
-                    await asyncio.sleep(0.5)
-                    await page.keyboard.press("End")
-                    current_scroll = max_scroll_height
-                else:
-                    # 滚动到指定位置
-                    logger.info(f"滚动容器到位置: {next_scroll}")
-                    await page.evaluate(f"""
-                        () => {{
-                            const scrollContainer = document.querySelector('.detail-container__body') || 
-                                                  document.querySelector('#container') ||
-                                                  document.body;
-                            scrollContainer.scrollTop = {next_scroll};
-                            if (scrollContainer === document.body) {{
-                                window.scrollTo({{top: {next_scroll}, behavior: 'smooth'}});
-                            }}
-                        }}
-                    """)
-                    await asyncio.sleep(0.5)
-                    # 使用鼠标滚轮辅助滚动
-                    await page.mouse.wheel(0, scroll_step // 2)
-                    current_scroll = next_scroll
+                    if is_duplicate:
+                        stalled_frames += 1
+                        duplicate_frames += 1
+                        os.remove(temp_screenshot_path)
+                        logger.info(f"第 {screenshot_index + 1} 张截图与上一张重复(差异={difference:.2f})，已丢弃")
+                        if stalled_frames >= settings.max_stalled_frames:
+                            logger.info(f"连续 {stalled_frames} 张重复截图，页面已停止滚动")
+                            break
+                    else:
+                        stalled_frames = 0
+                        kept_scroll = frame_scroll
+                        screenshots.append(temp_screenshot_path)
+                        logger.info(f"保存截图: {temp_screenshot_path}")
+                        await report("frame", index=len(screenshots) - 1, scroll=current_scroll,
+                                     scroll_height=max_scroll_height, path=temp_screenshot_path)
                 
-                # 等待滚动完成和内容加载
-                await asyncio.sleep(1)
+                    # 计算下一次滚动位置
+                    next_scroll = current_scroll + scroll_step
                 
-                # 检查实际滚动位置
-                actual_scroll = await page.evaluate("""
-                    () => {
-                        const scrollContainer = document.querySelector('.detail-container__body') || 
-                                              document.querySelector('#container') ||
-                                              document.body;
-                        return scrollContainer.scrollTop;
-                    }
-                """)
-                logger.info(f"期望滚动位置: {current_scroll}, 实际滚动位置: {actual_scroll}")
+                    # 滚动到下一个位置 - 使用容器滚动
+                    if next_scroll >= max_scroll_height:
+                        # 滚动到底部
+                        logger.info("滚动到容器底部")
+                        await page.evaluate("""
+                            () => {
+                                const scrollContainer = document.querySelector('.detail-container__body') || 
+                                                      document.querySelector('#container') ||
+                                                      document.body;
+                                scrollContainer.scrollTop = scrollContainer.scrollHeight;
+                                if (scrollContainer === document.body) {
+                                    window.scrollTo({top: document.body.scrollHeight, behavior: 'smooth'});
+                                }
+                            }
+                        """)
+                        await timer.wait(0.5)
+                        await page.keyboard.press("End")
+                        current_scroll = max_scroll_height
+                    else:
+                        # 滚动到指定位置
+                        logger.info(f"滚动容器到位置: {next_scroll}")
+                        await page.evaluate(f"""
+                            () => {{
+                                const scrollContainer = document.querySelector('.detail-container__body') || 
+                                                      document.querySelector('#container') ||
+                                                      document.body;
+                                scrollContainer.scrollTop = {next_scroll};
+                                if (scrollContainer === document.body) {{
+                                    window.scrollTo({{top: {next_scroll}, behavior: 'smooth'}});
+                                }}
+                            }}
+                        """)
+                        await timer.wait(0.5)
+                        # 使用鼠标滚轮辅助滚动
+                        await page.mouse.wheel(0, scroll_step // 2)
+                        current_scroll = next_scroll
                 
-                # 如果滚动位置差异很大，说明页面可能有特殊的滚动行为
-                if abs(actual_scroll - current_scroll) > 50:
-                    logger.info(f"滚动位置差异较大，调整当前位置记录")
-                    current_scroll = actual_scroll
+                    # 等待滚动完成和内容加载
+                    await timer.wait(1)
                 
-                # 如果连续两次实际滚动位置相同，说明到达底部或无法继续滚动
-                if screenshot_index > 0 and actual_scroll > 0:
-                    # 检查是否到达底部
-                    container_info = await page.evaluate("""
+                    # 检查实际滚动位置
+                    actual_scroll = await page.evaluate("""
                         () => {
                             const scrollContainer = document.querySelector('.detail-container__body') || 
                                                   document.querySelector('#container') ||
                                                   document.body;
-                            return {
-                                scrollTop: scrollContainer.scrollTop,
-                                scrollHeight: scrollContainer.scrollHeight,
-                                clientHeight: scrollContainer.clientHeight,
-                                isAtBottom: scrollContainer.scrollTop + scrollContainer.clientHeight >= scrollContainer.scrollHeight - 10
-                            };
+                            return scrollContainer.scrollTop;
                         }
                     """)
+                    logger.info(f"期望滚动位置: {current_scroll}, 实际滚动位置: {actual_scroll}")
+                    frame_scroll = actual_scroll
+                
+                    # 如果滚动位置差异很大，说明页面可能有特殊的滚动行为
+                    if abs(actual_scroll - current_scroll) > 50:
+                        logger.info(f"滚动位置差异较大，调整当前位置记录")
+                        current_scroll = actual_scroll
+                
+                    # 如果连续两次实际滚动位置相同，说明到达底部或无法继续滚动
+                    if screenshot_index > 0 and actual_scroll > 0:
+                        # 检查是否到达底部
+                        container_info = await page.evaluate("""
+                            () => {
+                                const scrollContainer = document.querySelector('.detail-container__body') || 
+                                                      document.querySelector('#container') ||
+                                                      document.body;
+                                return {
+                                    scrollTop: scrollContainer.scrollTop,
+                                    scrollHeight: scrollContainer.scrollHeight,
+                                    clientHeight: scrollContainer.clientHeight,
+                                    isAtBottom: scrollContainer.scrollTop + scrollContainer.clientHeight >= scrollContainer.scrollHeight - 10
+                                };
+                            }
+                        """)
                     
-                    if container_info['isAtBottom']:
-                        logger.info("已到达容器底部")
-                        break
+                        if container_info['isAtBottom']:
+                            logger.info("已到达容器底部")
+                            break
                 
-                screenshot_index += 1
+                    screenshot_index += 1
                 
-                # 防止无限循环
-                if screenshot_index >= 20:
-                    logger.warning("达到最大截图数量限制")
-                    break
+                    # 防止无限循环
+                    if screenshot_index >= settings.max_screenshot_count:
+                        logger.warning("达到最大截图数量限制")
+                        break
             
             logger.info(f"总共截取了 {len(screenshots)} 张图片，开始拼接...")
+            await report("stitching", frames=len(screenshots))
             
             # 生成最终输出路径
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_path = os.path.join(output_dir, f"douyin_long_screenshot_{timestamp}.png")
+            output_path = os.path.join(output_dir, f"douyin_long_screenshot_{timestamp}_{capture_id}.png")
             
-            # 拼接图片
-            if len(screenshots) == 1:
-                # 只有一张图片，直接重命名
-                os.rename(screenshots[0], output_path)
-                total_height = Image.open(output_path).height
-            else:
-                # 拼接多张图片
-                total_height = await self._stitch_screenshots(screenshots, output_path, crop_bottom_pixels)
+            # 拼接图片（单张图片同样经过编码，以输出请求的格式）
+            stitch_result = await deadline.run(
+                "stitch", self._stitch_screenshots(screenshots, output_path, crop_bottom_pixels, options, timer)
+            )
             
             # 保留调试截图，不删除临时文件
             logger.info("调试截图已保存，可以逐张检查:")
@@ -499,94 +641,428 @@ class PlaywrightService:
             #     if os.path.exists(temp_file):
             #         os.remove(temp_file)
             
-            await page.close()
-            
+            outcome = "success"
+            span_attributes = {"frames": len(screenshots), "duplicate_frames": duplicate_frames,
+                               "bytes": stitch_result.get("file_size"), "height": stitch_result.get("total_height")}
+            timer.resources["frame_count"] = len(screenshots)
             return {
                 "success": True,
-                "output_path": output_path,
                 "screenshot_count": len(screenshots),
-                "total_height": total_height,
-                "file_size": os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+                "duplicate_frames": duplicate_frames,
+                **stitch_result,
                 "original_url": url,
                 "current_url": page.url,
-                "title": await page.title() if not page.is_closed() else ""
+                "title": await page.title(),
+                "timings": timer.timings(),
+                "resources": dict(timer.resources)
             }
             
+        except CaptureTimeoutError as e:
+            outcome = "timeout"
+            error = e
+            logger.warning(f"长截图超时: {url}, {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "timeout": True,
+                "stage": e.stage,
+                "original_url": url,
+                "timings": timer.timings()
+            }
+        except asyncio.CancelledError as e:
+            outcome = "cancelled"
+            error = e
+            logger.info(f"长截图已取消: {url}")
+            raise
         except Exception as e:
+            error = e
             logger.error(f"长截图失败: {e}")
             return {
                 "success": False,
                 "error": str(e),
-                "original_url": url
+                "original_url": url,
+                "timings": timer.timings()
+            }
+        finally:
+            # 出错、超时或取消时同样关闭页面，释放浏览器资源
+            if page is not None and not page.is_closed():
+                try:
+                    await page.close()
+                except Exception as e:
+                    logger.warning(f"关闭页面失败: {e}")
+            elapsed = timer.finish(outcome, error, **span_attributes)
+            self.last_capture = {
+                "outcome": outcome,
+                "seconds": round(elapsed, 3),
+                "finished_at": time.time()
             }
     
-    async def _stitch_screenshots(self, screenshot_paths: List[str], output_path: str, crop_bottom_pixels: int = 300) -> int:
+    @staticmethod
+    def _track_network(page: Page, timer: StageTimer):
+        """
+        统计页面的请求数和下载字节数（响应头加响应体，命中浏览器缓存的资源不计入），写入timer.resources
+        """
+        timer.resources["requests"] = 0
+        timer.resources["bytes_downloaded"] = 0
+
+        async def on_request_finished(request):
+            timer.resources["requests"] += 1
+            try:
+                sizes = await request.sizes()
+            except Exception:
+                # 页面已关闭
+                return
+            timer.resources["bytes_downloaded"] += sizes["responseHeadersSize"] + sizes["responseBodySize"]
+
+        page.on("requestfinished", on_request_finished)
+
+    @staticmethod
+    def _count_redirects(response) -> int:
+        """主文档经过的重定向次数（短链接通常有一到两次）"""
+        count = 0
+        request = response.request.redirected_from
+        while request is not None:
+            count += 1
+            request = request.redirected_from
+        return count
+    
+    @staticmethod
+    def create_deadline(options: Optional[LongScreenshotOptions] = None) -> Deadline:
+        """
+        按请求选项和配置创建截止时间
+        
+        Args:
+            options: 长截图选项，timeout和stage_timeouts覆盖默认配置
+        """
+        options = options or LongScreenshotOptions()
+        stage_timeouts = {
+            "queue": settings.queue_timeout,
+            "navigation": settings.navigation_timeout,
+            "preload": settings.preload_timeout,
+            "frames": settings.frames_timeout,
+            "stitch": settings.stitch_timeout,
+            **(options.stage_timeouts or {})
+        }
+        return Deadline(options.timeout or settings.capture_timeout, stage_timeouts)
+    
+    async def _stitch_screenshots(self, screenshot_paths: List[str], output_path: str, crop_bottom_pixels: int = 300,
+                                  options: Optional[LongScreenshotOptions] = None,
+                                  timer: Optional[StageTimer] = None) -> Dict[str, Any]:
         """
         拼接多张截图
         
+        解码、拼接和编码都是CPU密集操作，放到线程池中执行，避免阻塞同时进行的其他截图任务。
+        
         Args:
             screenshot_paths: 截图文件路径列表
-            output_path: 输出文件路径
+            output_path: 输出文件路径，扩展名按实际输出格式替换
             crop_bottom_pixels: 底部裁剪像素数
+            options: 长截图选项，决定输出格式和编码参数
+            timer: 阶段计时器，记录编码耗时
             
         Returns:
-            拼接后的总高度
+            输出路径、格式、总高度和文件大小等信息
         """
+        options = options or LongScreenshotOptions()
+        timer = timer or StageTimer()
+        loop = asyncio.get_running_loop()
         try:
-            logger.info(f"拼接 {len(screenshot_paths)} 张图片，底部裁剪: {crop_bottom_pixels}px...")
-            
-            # 打开所有图片
-            images = []
-            for path in screenshot_paths:
-                if os.path.exists(path):
-                    img = Image.open(path)
-                    images.append(img)
-            
-            if not images:
-                raise Exception("没有有效的图片可以拼接")
-            
-            # 计算拼接后的尺寸
-            total_width = images[0].width
-            if len(images) == 1:
-                total_height = images[0].height
-            else:
-                # 前面的图片去掉底部crop_bottom_pixels，最后一张图片完整保留
-                total_height = sum(img.height - crop_bottom_pixels for img in images[:-1]) + images[-1].height
-            
-            logger.info(f"拼接图片尺寸: {total_width} x {total_height}")
-            
-            # 创建新的图片
-            result_image = Image.new('RGB', (total_width, total_height))
-            
-            # 拼接图片
-            y_offset = 0
-            for i, img in enumerate(images):
-                if i == len(images) - 1:
-                    # 最后一张图片完整保留
-                    result_image.paste(img, (0, y_offset))
-                    y_offset += img.height
-                else:
-                    # 前面的图片去掉底部区域
-                    if img.height > crop_bottom_pixels:
-                        cropped_img = img.crop((0, 0, img.width, img.height - crop_bottom_pixels))
-                        result_image.paste(cropped_img, (0, y_offset))
-                        y_offset += cropped_img.height
-                        cropped_img.close()
-                    else:
-                        logger.warning(f"图片 {i+1} 高度({img.height})小于裁剪区域({crop_bottom_pixels})，跳过")
-                
-                img.close()
-            
-            # 保存拼接后的图片
-            result_image.save(output_path, 'PNG', quality=95)
-            result_image.close()
-            
-            logger.info("图片拼接完成")
-            return total_height
+            with timer.stage("stitch", frames=len(screenshot_paths), requested_format=options.output_format) as stage:
+                # 等待被取消（例如拼接阶段超时）时通知线程池中的拼接在下一帧前停止，不再占用CPU
+                cancelled = threading.Event()
+                try:
+                    result = await loop.run_in_executor(
+                        None, self._stitch_frames, screenshot_paths, output_path, crop_bottom_pixels, options,
+                        timer, cancelled
+                    )
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+                stage.set_attribute("output_format", result["output_format"])
+                stage.set_attribute("height", result["total_height"])
+                stage.set_attribute("bytes", result["file_size"])
+                stage.set_attribute("encode_ms", round(timer.durations.get("encode", 0.0) * 1000, 1))
+                stage.set_attribute("write_ms", round(timer.durations.get("write", 0.0) * 1000, 1))
+            if result.get("optimizing"):
+                self._schedule_recompress(result["output_path"])
+            return result
             
         except Exception as e:
             logger.error(f"图片拼接失败: {e}")
             raise
 
+    def _stitch_frames(self, screenshot_paths: List[str], output_path: str, crop_bottom_pixels: int,
+                       options: LongScreenshotOptions, timer: StageTimer,
+                       cancelled: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        逐帧解码、裁剪并写出拼接结果（在线程池中同步执行）
+        
+        Args:
+            screenshot_paths: 截图文件路径列表
+            output_path: 输出文件路径
+            crop_bottom_pixels: 底部裁剪像素数
+            options: 长截图选项
+            timer: 阶段计时器，写入各输出的耗时中写盘部分记为write阶段，其余记为encode阶段
+            cancelled: 取消标志，每帧写入前检查，设置后放弃已写出的部分并抛出StitchCancelledError
+            
+        Returns:
+            拼接结果信息
+        """
+        logger.info(f"拼接 {len(screenshot_paths)} 张图片，底部裁剪: {crop_bottom_pixels}px...")
+        
+        # 只读取图片头获取尺寸，像素数据在写入时逐帧解码
+        frame_paths = []
+        frame_sizes = []
+        for path in screenshot_paths:
+            if os.path.exists(path):
+                with Image.open(path) as img:
+                    frame_sizes.append(img.size)
+                frame_paths.append(path)
+        
+        if not frame_paths:
+            raise Exception("没有有效的图片可以拼接")
+        
+        # 计算拼接后的尺寸
+        total_width = frame_sizes[0][0]
+        # 前面的图片去掉底部crop_bottom_pixels，最后一张图片完整保留
+        total_height = sum(
+            height - crop_bottom_pixels for _, height in frame_sizes[:-1]
+            if height > crop_bottom_pixels
+        ) + frame_sizes[-1][1]
+        
+        logger.info(f"拼接图片尺寸: {total_width} x {total_height}")
+        
+        image_format, segment_height, fallback_reason = resolve_output_format(options.output_format, total_height)
+        if fallback_reason:
+            logger.warning(fallback_reason)
+        output_path = os.path.splitext(output_path)[0] + FILE_EXTENSIONS[image_format]
+        
+        # PNG编码参数，快速模式先用最低压缩级别输出，稍后在后台重新压缩
+        optimize_later = image_format == 'PNG' and (
+            options.png_optimize_later if options.png_optimize_later is not None
+            else settings.png_optimize_later
+        )
+        compress_level = 1 if optimize_later else (
+            options.png_compress_level if options.png_compress_level is not None
+            else settings.png_compress_level
+        )
+        
+        quality = options.quality or settings.screenshot_quality
+        if image_format == 'PNG' and settings.stream_png_output:
+            writer = StreamingPNGWriter(output_path, total_width, compress_level,
+                                        options.png_filter or settings.png_filter)
+        else:
+            save_params = build_save_params(image_format, quality, options.lossless, options.effort,
+                                            compress_level)
+            writer = CanvasImageWriter(output_path, total_width, total_height, image_format,
+                                       segment_height, **save_params)
+        
+        # 缩略图和预览图复用拼接时已解码的图片，不再重新读取输出文件
+        output_stem = os.path.splitext(output_path)[0]
+        thumbnail_writer = None
+        preview_writer = None
+        if options.thumbnail_width:
+            scale = min(options.thumbnail_width, total_width) / total_width
+            thumbnail_format, thumbnail_max_height = self._resolve_side_format(
+                options.thumbnail_format, max(1, round(total_height * scale)), "缩略图"
+            )
+            thumbnail_writer = OptionalOutputWriter(ThumbnailWriter(
+                f"{output_stem}_thumb{FILE_EXTENSIONS[thumbnail_format]}", total_width,
+                options.thumbnail_width, thumbnail_format, max_height=thumbnail_max_height,
+                **build_save_params(thumbnail_format, quality, effort=options.effort)
+            ), "缩略图")
+        if options.preview_height:
+            preview_height = min(options.preview_height, total_height)
+            preview_format, preview_max_height = self._resolve_side_format(
+                options.thumbnail_format, preview_height, "预览图"
+            )
+            preview_writer = OptionalOutputWriter(PreviewWriter(
+                f"{output_stem}_preview{FILE_EXTENSIONS[preview_format]}", total_width,
+                preview_max_height or preview_height, preview_format,
+                **build_save_params(preview_format, quality, effort=options.effort)
+            ), "预览图")
+        # 瓦片同样在拼接时逐条切出，不再重新解码输出文件
+        tile_writer = None
+        if options.tiles:
+            tile_writer = TilePyramidWriter(
+                os.path.dirname(output_path), os.path.basename(output_stem), total_width,
+                tile_size=options.tile_size,
+                overlap=options.tile_overlap,
+                tile_format=options.tile_format,
+                quality=quality
+            )
+        sinks = [sink for sink in (writer, thumbnail_writer, preview_writer, tile_writer) if sink is not None]
+        trimmer = None
+        if options.trim_blank:
+            trimmer = BlankRowTrimmer(settings.blank_min_run, settings.blank_keep_rows, settings.blank_tolerance)
+        
+        # 编码耗时：写入各输出和关闭输出（画布模式在关闭时整体编码）的时间，之后减去其中的写盘时间
+        encode_seconds = 0.0
+        
+        def write_pieces(pieces: List[Image.Image]):
+            nonlocal encode_seconds
+            started = time.perf_counter()
+            for piece in pieces:
+                for sink in sinks:
+                    sink.write(piece)
+            encode_seconds += time.perf_counter() - started
+        
+        def write_strip(strip: Image.Image):
+            pieces = trimmer.process(strip) if trimmer else [strip]
+            write_pieces(pieces)
+            for piece in pieces:
+                if piece is not strip:
+                    piece.close()
+        
+        with ExitStack() as stack:
+            for sink in sinks:
+                stack.enter_context(sink)
+            for i, path in enumerate(frame_paths):
+                if cancelled is not None and cancelled.is_set():
+                    raise StitchCancelledError(f"拼接已取消: {output_path}")
+                with Image.open(path) as img:
+                    if i == len(frame_paths) - 1:
+                        # 最后一张图片完整保留
+                        strip = img.convert('RGB')
+                    elif img.height > crop_bottom_pixels:
+                        # 前面的图片去掉底部区域
+                        strip = img.crop((0, 0, img.width, img.height - crop_bottom_pixels))
+                    else:
+                        logger.warning(f"图片 {i+1} 高度({img.height})小于裁剪区域({crop_bottom_pixels})，跳过")
+                        continue
+                with strip:
+                    write_strip(strip)
+            if trimmer:
+                pieces = trimmer.finish()
+                write_pieces(pieces)
+                for piece in pieces:
+                    piece.close()
+            close_started = time.perf_counter()
+        encode_seconds += time.perf_counter() - close_started
+        write_seconds = sum(sink.write_seconds for sink in sinks)
+        timer.add("encode", encode_seconds - write_seconds)
+        timer.add("write", write_seconds)
+        peak_width, peak_height = writer.peak_size
+        timer.resources["peak_canvas"] = {
+            "width": peak_width,
+            "height": peak_height,
+            "bytes": peak_width * peak_height * 3
+        }
+        
+        logger.info(f"图片拼接完成: {image_format}, {writer.width} x {writer.height}")
+        result = {
+            "output_path": writer.output_paths[0],
+            "output_format": image_format.lower(),
+            "total_height": writer.height,
+            "file_size": sum(os.path.getsize(path) for path in writer.output_paths)
+        }
+        if len(writer.output_paths) > 1:
+            result["segments"] = writer.output_paths
+        if thumbnail_writer and not thumbnail_writer.failed:
+            result["thumbnail_path"] = thumbnail_writer.output_path
+        if preview_writer and not preview_writer.failed:
+            result["preview_path"] = preview_writer.output_path
+        if tile_writer:
+            result["tiles"] = tile_writer.result
+        if trimmer:
+            result["trim_report"] = trimmer.report()
+            logger.info(f"空白裁剪: 移除 {result['trim_report']['removed_rows']} 行")
+        if fallback_reason:
+            result["fallback_reason"] = fallback_reason
+        if optimize_later:
+            result["optimizing"] = True
+        return result
+
+    @staticmethod
+    @asynccontextmanager
+    async def _page_stage(page: Page, deadline: Deadline, stage: str):
+        """
+        在阶段时限内执行页面操作
+
+        页面操作的默认超时取阶段可用时间，避免Playwright的超时先于阶段时限触发；
+        Playwright超时同样视为该阶段超时，结束后恢复默认超时。
+
+        Args:
+            page: 页面
+            deadline: 截止时间
+            stage: 阶段名称
+        """
+        limit = deadline.stage_limit(stage)
+        # Playwright中0表示不限时
+        page.set_default_timeout(max(1.0, limit * 1000))
+        try:
+            async with deadline.stage(stage):
+                try:
+                    yield
+                except PlaywrightTimeoutError:
+                    raise CaptureTimeoutError(stage, limit)
+        finally:
+            page.set_default_timeout(settings.screenshot_timeout * 1000)
+
+    @staticmethod
+    def _resolve_side_format(image_format: str, height: int, name: str) -> Tuple[str, Optional[int]]:
+        """
+        确定缩略图或预览图的实际格式，超出格式尺寸限制时回退为JPEG，仍超出时限制高度
+
+        Args:
+            image_format: 请求的格式
+            height: 预计高度（空白裁剪前的上限）
+            name: 输出名称，用于日志
+
+        Returns:
+            (实际格式, 高度上限)，高度上限为None表示不限制
+        """
+        side_format, max_height, fallback_reason = resolve_output_format(image_format, height)
+        if fallback_reason:
+            logger.warning(f"{name}: {fallback_reason}")
+        return side_format, max_height
+
+    @staticmethod
+    async def _report_progress(callback: Optional[Callable[[Dict[str, Any]], Any]], stage: str, **data):
+        """调用进度回调，回调出错只记录日志，不影响截图"""
+        if callback is None:
+            return
+        try:
+            outcome = callback({"stage": stage, **data})
+            if inspect.isawaitable(outcome):
+                await outcome
+        except Exception as e:
+            logger.warning(f"进度回调出错: {e}")
+
+    def _schedule_recompress(self, path: str):
+        """在专用线程池中重新压缩PNG，完成后原子替换原文件，超出并发数的压缩排队等待"""
+        if self._recompress_executor is None:
+            self._recompress_executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.png_recompress_workers), thread_name_prefix="png-recompress"
+            )
+        executor = self._recompress_executor
+
+        async def recompress():
+            try:
+                before, after = await asyncio.get_running_loop().run_in_executor(
+                    executor, recompress_png, path, 9
+                )
+                logger.info(f"后台压缩完成: {path}, {before} -> {after} 字节")
+            except Exception as e:
+                logger.error(f"后台压缩失败: {path}, {e}")
+        
+        task = asyncio.create_task(recompress())
+        self._background_tasks.add(task)
+        self._recompress_tasks[path] = task
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(lambda _: self._recompress_tasks.pop(path, None))
+
+    async def wait_recompressed(self, path: str):
+        """
+        等待文件的后台重新压缩完成，没有进行中的压缩时立即返回
+
+        Args:
+            path: 输出文件路径
+        """
+        task = self._recompress_tasks.get(path)
+        if task:
+            # 等待者被取消时不影响压缩任务
+            await asyncio.shield(task)
+
 # 全局服务实例
 playwright_service = PlaywrightService()
@@ -0,0 +1,347 @@
+"""
+截图结果缓存模块 - 以规范化后的最终URL和截图选项为键，在磁盘上缓存截图结果
+"""
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 结果中指向输出文件的字段
+FILE_FIELDS = ("output_path", "thumbnail_path", "preview_path")
+
+# 最多记住的短链接解析结果数，超出时淘汰最久未使用的
+MAX_RESOLVED_URLS = 10000
+
+# 移动端UA，短链接对桌面UA会跳转到不同的页面
+MOBILE_USER_AGENT = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    规范化URL：小写scheme和host，去掉默认端口、fragment和追踪参数，查询参数排序
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    ignored = {param.lower() for param in settings.cache_ignored_params}
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in ignored and not key.lower().startswith("utm_")
+    )
+    path = parts.path or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def _link_or_copy(src: str, dst: str):
+    """优先使用硬链接，避免复制大文件"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _move(src: str, dst: str):
+    """移动文件或目录，同一文件系统内只是改名"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        shutil.move(src, dst)
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+class ResultCache:
+    """
+    磁盘结果缓存
+
+    每个条目是cache_dir下的一个目录，输出文件从截图目录移动到条目目录，淘汰条目即释放磁盘空间。
+    条目按最近访问时间做LRU淘汰，总大小不超过cache_max_bytes。
+
+    正在后台重新压缩的PNG（optimizing）先以硬链接放入缓存，压缩完成后由finish_optimizing
+    将压缩后的文件移动过来替换链接。
+    """
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # 原始URL -> (规范化的最终URL, 解析时间)
+        self._resolved: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loaded = False
+
+    @property
+    def cache_dir(self) -> str:
+        return settings.cache_dir
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def _index_path(self) -> str:
+        return settings.cache_index_file
+
+    def _legacy_index_path(self) -> str:
+        """旧版本放在缓存目录（静态目录内）中的索引"""
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _load(self):
+        """首次使用时从磁盘加载索引，旧版本的索引迁移到cache_index_file后删除"""
+        if self._loaded:
+            return
+        self._loaded = True
+        legacy_path = self._legacy_index_path()
+        index_path = self._index_path()
+        if os.path.exists(legacy_path) and not os.path.exists(index_path):
+            index_path = legacy_path
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_access"]):
+                if os.path.isdir(os.path.join(self.cache_dir, key)):
+                    self.entries[key] = entry
+            logger.info(f"已加载结果缓存索引: {len(self.entries)} 条")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"加载结果缓存索引失败，将重新建立: {e}")
+        if os.path.exists(legacy_path):
+            self._save()
+            os.remove(legacy_path)
+
+    def _save(self):
+        """原子写入索引"""
+        directory = os.path.dirname(self._index_path())
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self._index_path() + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(temp_path, self._index_path())
+
+    async def close(self):
+        """关闭HTTP客户端"""
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def resolve_url(self, url: str) -> str:
+        """
+        解析短链接的最终地址并规范化
+
+        结果在cache_ttl_seconds内复用；解析失败时使用原始URL。
+        """
+        cached = self._resolved.get(url)
+        if cached and time.time() - cached[1] < settings.cache_ttl_seconds:
+            self._resolved.move_to_end(url)
+            return cached[0]
+
+        final_url = url
+        try:
+            if self._client is None:
+                self._client = httpx.AsyncClient(
+                    follow_redirects=True,
+                    timeout=settings.cache_resolve_timeout,
+                    headers={"User-Agent": MOBILE_USER_AGENT}
+                )
+            response = await self._client.head(url)
+            final_url = str(response.url)
+        except Exception as e:
+            logger.warning(f"解析最终URL失败，使用原始URL作为缓存键: {url}, {e}")
+
+        canonical_url = canonicalize_url(final_url)
+        self._remember_resolved(url, canonical_url)
+        return canonical_url
+
+    def remember_url(self, url: str, final_url: str):
+        """记录浏览器实际访问到的最终地址，供后续请求直接使用"""
+        self._remember_resolved(url, canonicalize_url(final_url))
+
+    def _remember_resolved(self, url: str, canonical_url: str):
+        """记录解析结果，超过MAX_RESOLVED_URLS时淘汰最久未使用的"""
+        self._resolved[url] = (canonical_url, time.time())
+        self._resolved.move_to_end(url)
+        while len(self._resolved) > MAX_RESOLVED_URLS:
+            self._resolved.popitem(last=False)
+
+    @staticmethod
+    def make_key(canonical_url: str, options_key: str) -> str:
+        """由规范化URL和选项生成缓存键"""
+        return hashlib.sha256(f"{canonical_url}\n{options_key}".encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存，命中时刷新LRU顺序
+
+        Returns:
+            缓存的截图结果，未命中或已过期时返回None
+        """
+        self._load()
+        entry = self.entries.get(key)
+        if entry and time.time() - entry["created_at"] > settings.cache_ttl_seconds:
+            self._remove(key)
+            self._save()
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry["last_access"] = time.time()
+        self.entries.move_to_end(key)
+        return dict(entry["result"])
+
+    async def put(self, key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        保存截图结果到缓存，输出文件移动到缓存目录
+
+        Returns:
+            文件路径指向缓存目录的结果副本
+        """
+        self._load()
+        entry_dir = os.path.join(self.cache_dir, key)
+        cached_result, size = await asyncio.get_running_loop().run_in_executor(
+            None, self._store_files, entry_dir, result
+        )
+        now = time.time()
+        if key in self.entries:
+            del self.entries[key]
+        self.entries[key] = {
+            "created_at": now,
+            "last_access": now,
+            "size": size,
+            "result": cached_result
+        }
+        if result.get("optimizing"):
+            # 压缩完成前原文件仍在截图目录中
+            self.entries[key]["pending_source"] = result["output_path"]
+        self._evict(keep=key)
+        self._save()
+        return dict(cached_result)
+
+    async def finish_optimizing(self, key: str, source_path: str):
+        """
+        后台压缩完成后，将压缩后的文件移动到缓存中替换硬链接，并更新大小
+
+        条目已被淘汰或刷新时只删除原文件。
+
+        Args:
+            key: 缓存键
+            source_path: 截图目录中的原输出文件
+        """
+        self._load()
+        entry = self.entries.get(key)
+        if entry is None or entry.get("pending_source") != source_path:
+            if os.path.exists(source_path):
+                os.remove(source_path)
+            return
+        cached_result = entry["result"]
+        await asyncio.get_running_loop().run_in_executor(
+            None, _move, source_path, cached_result["output_path"]
+        )
+        cached_result["file_size"] = os.path.getsize(cached_result["output_path"])
+        cached_result.pop("optimizing", None)
+        del entry["pending_source"]
+        entry["size"] = _tree_size(os.path.join(self.cache_dir, key))
+        self._evict(keep=key)
+        self._save()
+
+    def _store_files(self, entry_dir: str, result: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+        """将结果中的文件移动到条目目录，并改写结果中的路径"""
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.makedirs(entry_dir)
+
+        moved: List[Tuple[str, str]] = []
+
+        def store(path: str, link: bool = False) -> str:
+            target = os.path.join(entry_dir, os.path.basename(path))
+            if link:
+                _link_or_copy(path, target)
+            else:
+                _move(path, target)
+                moved.append((path, target))
+            return target
+
+        cached = dict(result)
+        try:
+            for field in FILE_FIELDS:
+                if cached.get(field):
+                    # 后台压缩完成前原文件还会被替换，先放入硬链接
+                    link = field == "output_path" and bool(result.get("optimizing"))
+                    cached[field] = store(cached[field], link=link)
+            if cached.get("segments"):
+                cached["segments"] = [
+                    cached["output_path"] if index == 0 else store(path)
+                    for index, path in enumerate(cached["segments"])
+                ]
+            if cached.get("tiles"):
+                tiles = dict(cached["tiles"])
+                for field in ("manifest_path", "dzi_path", "tiles_dir"):
+                    tiles[field] = store(tiles[field])
+                cached["tiles"] = tiles
+        except Exception:
+            # 移回已移动的文件，保证原结果中的路径仍然有效
+            for source, target in reversed(moved):
+                _move(target, source)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            raise
+        cached["file_size"] = sum(os.path.getsize(path) for path in cached.get("segments") or [cached["output_path"]])
+        return cached, _tree_size(entry_dir)
+
+    def _remove(self, key: str):
+        """删除条目及其文件"""
+        self.entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def _evict(self, keep: Optional[str] = None):
+        """
+        淘汰过期条目和解析结果，再按LRU淘汰直到总大小不超过上限
+
+        Args:
+            keep: 不淘汰的条目（刚写入的条目），即使它本身超过上限
+        """
+        expire_before = time.time() - settings.cache_ttl_seconds
+        for url in [url for url, (_, resolved_at) in self._resolved.items() if resolved_at < expire_before]:
+            del self._resolved[url]
+        for key in [key for key, entry in self.entries.items()
+                    if entry["created_at"] < expire_before and key != keep]:
+            self._remove(key)
+        total = self.total_bytes
+        for key in [key for key in self.entries if key != keep]:
+            if total <= settings.cache_max_bytes:
+                break
+            total -= self.entries[key]["size"]
+            self._remove(key)
+            logger.info(f"结果缓存超出容量，淘汰条目 {key}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        self._load()
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+# 全局缓存实例
+result_cache = ResultCache()
@@ -0,0 +1,121 @@
+"""
+回调通知模块 - 任务完成后向回调地址POST结果，失败时按指数退避重试
+"""
+from typing import Optional, Dict, Any, Set
+import asyncio
+import json
+import logging
+import os
+import random
+import httpx
+from app.core.config import settings
+from app.utils.file_stream import media_type_for
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookService:
+    def __init__(self):
+        # 所有回调共用一个连接池
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=settings.webhook_timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.webhook_max_connections,
+                    max_keepalive_connections=settings.webhook_max_connections
+                ),
+                headers={"User-Agent": f"{settings.app_name}/{settings.version}"}
+            )
+        return self._client
+
+    def schedule(self, callback_url: str, payload: Dict[str, Any], image_path: Optional[str] = None,
+                 status: Optional[Dict[str, Any]] = None) -> asyncio.Task:
+        """
+        在后台发送回调，不阻塞调用方
+
+        Args:
+            callback_url: 回调地址
+            payload: 结果元数据
+            image_path: 需要附带的图片路径，为None时只发送JSON
+            status: 用于记录投递状态的字典，发送过程中原地更新
+        """
+        task = asyncio.create_task(self.deliver(callback_url, payload, image_path, status))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def deliver(self, callback_url: str, payload: Dict[str, Any], image_path: Optional[str] = None,
+                      status: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        发送回调，网络错误、5xx和429时按指数退避重试
+
+        附带图片时以multipart/form-data发送，元数据在payload字段中；否则发送JSON。
+
+        Returns:
+            是否投递成功
+        """
+        status = status if status is not None else {}
+        status.update({"url": callback_url, "status": "pending", "attempts": 0, "last_error": None})
+        body = json.dumps(payload, ensure_ascii=False)
+        client = self._get_client()
+
+        for attempt in range(1, settings.webhook_max_attempts + 1):
+            status["attempts"] = attempt
+            retry_after = None
+            try:
+                if image_path and os.path.exists(image_path):
+                    with open(image_path, "rb") as f:
+                        response = await client.post(callback_url, data={"payload": body}, files={
+                            "image": (os.path.basename(image_path), f, media_type_for(image_path))
+                        })
+                else:
+                    response = await client.post(
+                        callback_url, content=body.encode("utf-8"),
+                        headers={"Content-Type": "application/json"}
+                    )
+                if response.status_code < 300:
+                    status["status"] = "delivered"
+                    logger.info(f"回调已送达: {callback_url}")
+                    return True
+                status["last_error"] = f"HTTP {response.status_code}"
+                if response.status_code < 500 and response.status_code != 429:
+                    # 其他4xx说明请求本身被拒绝，重试没有意义
+                    break
+                retry_after = response.headers.get("Retry-After")
+            except httpx.HTTPError as e:
+                status["last_error"] = f"{type(e).__name__}: {e}"
+
+            if attempt < settings.webhook_max_attempts:
+                delay = self._backoff(attempt, retry_after)
+                logger.warning(f"回调失败({status['last_error']})，{delay:.1f} 秒后第 {attempt + 1} 次重试: {callback_url}")
+                await asyncio.sleep(delay)
+
+        status["status"] = "failed"
+        logger.error(f"回调投递失败，已尝试 {status['attempts']} 次: {callback_url}, {status['last_error']}")
+        return False
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        """指数退避加随机抖动，服务端给出Retry-After时优先使用"""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.webhook_backoff_max)
+        delay = min(settings.webhook_backoff_base * 2 ** (attempt - 1), settings.webhook_backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def close(self):
+        """等待进行中的回调结束（超时则取消）并关闭连接池"""
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=settings.webhook_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+# 全局服务实例
+webhook_service = WebhookService()
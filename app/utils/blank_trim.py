@@ -0,0 +1,156 @@
+"""
+空白区域裁剪模块 - 折叠拼接结果中的大段纯色行
+"""
+from array import array
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+
+def uniform_rows(image: Image.Image, tolerance: int = 4) -> Tuple[List[bool], bytes]:
+    """
+    逐行判断是否为纯色行
+
+    以每行第一个像素为基准，整条图片一次性计算差值并按行求均值，
+    全部在Pillow的C实现中完成，不需要逐像素循环。
+
+    Args:
+        image: RGB图片
+        tolerance: 允许的灰度差
+
+    Returns:
+        (每行是否纯色, 每行第一个像素的RGB字节)
+    """
+    width, height = image.size
+    first_column = image.crop((0, 0, 1, height))
+    reference = first_column.resize((width, height), Image.NEAREST)
+    difference = ImageChops.difference(image, reference).convert('L')
+    # 超出容差的像素记为1，按行求均值后只有全部像素都在容差内的行为0
+    exceeded = difference.point(lambda value: 1 if value > tolerance else 0).convert('F')
+    row_means = array('f', exceeded.resize((1, height), Image.BOX).tobytes())
+    colors = first_column.tobytes()
+    first_column.close()
+    reference.close()
+    difference.close()
+    exceeded.close()
+    return [mean == 0 for mean in row_means], colors
+
+
+class BlankRowTrimmer:
+    """
+    流式空白行裁剪器
+
+    逐条接收拼接用的图片，连续纯色行达到min_run时只保留前keep_rows行，其余丢弃。
+    连续区域可以跨越多条图片；被暂缓的纯色行只记录颜色和行数，不占用图片内存。
+    """
+
+    def __init__(self, min_run: int = 300, keep_rows: int = 60, tolerance: int = 4):
+        self.min_run = min_run
+        self.keep_rows = keep_rows
+        self.tolerance = tolerance
+        self.width = 0
+        self.input_height = 0
+        self.output_height = 0
+        self.runs: List[Dict[str, int]] = []
+        # 当前纯色区域：颜色、起始行、已输出行数、暂缓行数
+        self._run_color: Optional[bytes] = None
+        self._run_start = 0
+        self._run_emitted = 0
+        self._run_held = 0
+
+    def _same_color(self, a: bytes, b: bytes) -> bool:
+        return all(abs(x - y) <= self.tolerance for x, y in zip(a, b))
+
+    def _end_run(self, plan: List[Tuple]):
+        """结束当前纯色区域，区域较短时补回暂缓的行"""
+        if self._run_color is None:
+            return
+        run_length = self._run_emitted + self._run_held
+        if self._run_held:
+            if run_length >= self.min_run:
+                self.runs.append({
+                    "offset": self._run_start,
+                    "length": run_length,
+                    "removed": self._run_held
+                })
+            else:
+                plan.append(('fill', self._run_color, self._run_held))
+        self._run_color = None
+        self._run_emitted = 0
+        self._run_held = 0
+
+    def process(self, image: Image.Image) -> List[Image.Image]:
+        """
+        处理一条图片
+
+        Returns:
+            需要写出的图片列表（调用方负责关闭）
+        """
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        self.width = image.width
+        flags, colors = uniform_rows(image, self.tolerance)
+
+        # 写出计划：('crop', 起始行, 结束行) 或 ('fill', 颜色, 行数)
+        plan: List[Tuple] = []
+        for y, is_uniform in enumerate(flags):
+            color = colors[y * 3:y * 3 + 3]
+            if is_uniform and self._run_color is not None and self._same_color(color, self._run_color):
+                if self._run_emitted < self.keep_rows:
+                    self._run_emitted += 1
+                    self._plan_row(plan, y)
+                else:
+                    self._run_held += 1
+                continue
+
+            self._end_run(plan)
+            if is_uniform:
+                self._run_color = color
+                self._run_start = self.input_height + y
+                self._run_emitted = 1
+            self._plan_row(plan, y)
+
+        self.input_height += image.height
+        return self._render(image, plan)
+
+    def finish(self) -> List[Image.Image]:
+        """所有图片处理完毕，结束末尾的纯色区域"""
+        plan: List[Tuple] = []
+        self._end_run(plan)
+        return self._render(None, plan)
+
+    @staticmethod
+    def _plan_row(plan: List[Tuple], y: int):
+        """将一行加入写出计划，与相邻行合并"""
+        if plan and plan[-1][0] == 'crop' and plan[-1][2] == y:
+            plan[-1] = ('crop', plan[-1][1], y + 1)
+        else:
+            plan.append(('crop', y, y + 1))
+
+    def _render(self, image: Optional[Image.Image], plan: List[Tuple]) -> List[Image.Image]:
+        """按写出计划生成图片"""
+        pieces = []
+        for step in plan:
+            if step[0] == 'crop':
+                _, top, bottom = step
+                if top == 0 and bottom == image.height:
+                    piece = image.copy()
+                else:
+                    piece = image.crop((0, top, image.width, bottom))
+            else:
+                _, color, rows = step
+                piece = Image.new('RGB', (self.width, rows), tuple(color))
+            self.output_height += piece.height
+            pieces.append(piece)
+        return pieces
+
+    def report(self) -> Dict[str, Any]:
+        """裁剪报告"""
+        return {
+            "original_height": self.input_height,
+            "trimmed_height": self.output_height,
+            "removed_rows": self.input_height - self.output_height,
+            "runs": self.runs
+        }
@@ -0,0 +1,87 @@
+"""
+截止时间模块 - 整体截止时间和各阶段时限
+"""
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Awaitable, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+# 截图的各个阶段：排队、打开页面、触发懒加载、逐帧截图、拼接编码
+STAGES = ("queue", "navigation", "preload", "frames", "stitch")
+
+
+class CaptureTimeoutError(Exception):
+    """截图超过截止时间"""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"截图超时: {stage} 阶段超过 {timeout:.1f} 秒")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class Deadline:
+    """
+    一次截图的截止时间
+
+    每个阶段的可用时间取阶段时限和整体剩余时间中的较小值。
+    """
+
+    def __init__(self, timeout: float, stage_timeouts: Optional[Dict[str, float]] = None):
+        self.timeout = timeout
+        self.stage_timeouts = stage_timeouts or {}
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """整体剩余秒数"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def stage_limit(self, stage: str) -> float:
+        """阶段可用秒数"""
+        limit = self.stage_timeouts.get(stage)
+        remaining = self.remaining()
+        return remaining if limit is None else min(limit, remaining)
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """
+        在阶段时限内执行，超时时取消并抛出CaptureTimeoutError
+
+        Args:
+            stage: 阶段名称
+            awaitable: 要执行的协程
+        """
+        limit = self.stage_limit(stage)
+        try:
+            return await asyncio.wait_for(awaitable, timeout=limit)
+        except asyncio.TimeoutError:
+            raise CaptureTimeoutError(stage, limit)
+
+    @asynccontextmanager
+    async def stage(self, stage: str):
+        """
+        限制代码块的执行时间，超时时取消当前任务中正在等待的操作并抛出CaptureTimeoutError
+
+        与run相同，但适用于包含多个步骤的代码块。
+        """
+        limit = self.stage_limit(stage)
+        task = asyncio.current_task()
+        expired = False
+
+        def expire():
+            nonlocal expired
+            expired = True
+            task.cancel()
+
+        handle = asyncio.get_running_loop().call_later(limit, expire)
+        try:
+            yield
+        except asyncio.CancelledError:
+            if not expired:
+                raise
+            # 超时引起的取消不算外部取消
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            raise CaptureTimeoutError(stage, limit)
+        finally:
+            handle.cancel()
@@ -0,0 +1,235 @@
+"""
+文件流式响应模块 - 分块读取截图文件，支持HTTP Range请求
+"""
+from collections import OrderedDict
+from typing import Optional, Tuple, AsyncIterator, Dict
+import asyncio
+import hashlib
+import mimetypes
+import os
+import aiofiles
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from app.core.config import settings
+
+CHUNK_SIZE = 256 * 1024
+
+# ETag缓存：(路径, 修改时间, 大小) -> ETag，文件被替换后自动失效
+ETAG_CACHE_SIZE = 1024
+_etag_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+
+# 部分Python版本的mimetypes不包含webp/avif
+MEDIA_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+    '.json': 'application/json',
+    '.dzi': 'application/xml',
+}
+
+# 结果中可以通过下载接口获取的文件字段
+DOWNLOADABLE_FIELDS = ("output_path", "thumbnail_path", "preview_path")
+
+
+def media_type_for(path: str) -> str:
+    """根据扩展名获取Content-Type"""
+    extension = os.path.splitext(path)[1].lower()
+    return MEDIA_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def download_url(path: str) -> str:
+    """静态目录内的文件使用可缓存的/results地址，否则使用截图下载接口"""
+    relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.static_dir))
+    if not relative_path.startswith(os.pardir):
+        return "/results/" + relative_path.replace(os.sep, "/")
+    relative_path = os.path.relpath(path, settings.screenshot_dir)
+    return "/douyin/screenshots/" + relative_path.replace(os.sep, "/")
+
+
+def with_download_urls(result: dict) -> dict:
+    """为结果中的输出文件补充下载地址"""
+    for field in DOWNLOADABLE_FIELDS:
+        path = result.get(field)
+        if path:
+            result[field.replace("_path", "_url")] = download_url(path)
+    return result
+
+
+def resolve_file(base_dir: str, relative_path: str) -> str:
+    """
+    将请求路径解析为base_dir内的文件，禁止访问目录之外的文件
+
+    Raises:
+        HTTPException: 文件不存在或路径越界时返回404
+    """
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, relative_path))
+    if os.path.commonpath([base, path]) != base or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"文件不存在: {relative_path}")
+    return path
+
+
+def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围
+
+    Args:
+        range_header: Range请求头，例如 bytes=0-1023、bytes=1024-、bytes=-500
+        file_size: 文件大小
+
+    Returns:
+        (起始字节, 结束字节)，均包含在内；无Range或格式不支持时返回None
+
+    Raises:
+        ValueError: 范围无法满足
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    # 多段范围不常用，按完整文件返回
+    if ',' in spec or '-' not in spec:
+        return None
+    start_text, end_text = spec.split('-', 1)
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+        else:
+            suffix = int(end_text)
+            if suffix == 0:
+                raise ValueError("空的后缀范围")
+            start = max(0, file_size - suffix)
+            end = file_size - 1
+    except ValueError:
+        raise ValueError(f"无效的Range: {range_header}")
+    end = min(end, file_size - 1)
+    if start > end or start >= file_size:
+        raise ValueError(f"Range超出文件大小: {range_header}")
+    return start, end
+
+
+async def iter_file(path: str, start: int = 0, end: Optional[int] = None,
+                    chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """异步分块读取文件的[start, end]区间"""
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await f.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(path: str, range_header: Optional[str] = None,
+                  headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """
+    构造文件的流式响应
+
+    Args:
+        path: 文件路径
+        range_header: Range请求头，存在时返回206部分内容
+        headers: 额外的响应头
+
+    Returns:
+        带Content-Type、Content-Length和Accept-Ranges的流式响应
+    """
+    file_size = os.path.getsize(path)
+    response_headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f'inline; filename="{os.path.basename(path)}"',
+        **(headers or {})
+    }
+    try:
+        byte_range = parse_range(range_header, file_size)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=416,
+            detail=str(e),
+            headers={'Content-Range': f'bytes */{file_size}'}
+        )
+
+    if byte_range is None:
+        response_headers['Content-Length'] = str(file_size)
+        return StreamingResponse(iter_file(path), media_type=media_type_for(path), headers=response_headers)
+
+    start, end = byte_range
+    response_headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+    response_headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(path, start, end),
+        status_code=206,
+        media_type=media_type_for(path),
+        headers=response_headers
+    )
+
+
+def _hash_file(path: str) -> str:
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_etag(path: str) -> str:
+    """
+    获取文件的强ETag（内容哈希）
+
+    哈希结果按路径、修改时间和大小缓存，重复请求不再读取文件。
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    etag = _etag_cache.get(key)
+    if etag is None:
+        content_hash = await asyncio.get_running_loop().run_in_executor(None, _hash_file, path)
+        etag = f'"{content_hash[:32]}"'
+        _etag_cache[key] = etag
+        if len(_etag_cache) > ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    else:
+        _etag_cache.move_to_end(key)
+    return etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断If-None-Match是否命中（按弱比较规则）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
+
+async def cached_file_response(path: str, request: Request, max_age: int) -> Response:
+    """
+    构造带缓存校验的文件响应
+
+    返回强ETag和Cache-Control，If-None-Match命中时返回304；
+    If-Range与ETag不一致时忽略Range，返回完整文件。
+
+    Args:
+        path: 文件路径
+        request: 当前请求
+        max_age: Cache-Control的max-age秒数
+    """
+    etag = await file_etag(path)
+    cache_headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={max_age}, immutable',
+    }
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    return file_response(path, range_header, headers=cache_headers)
@@ -0,0 +1,34 @@
+"""
+帧指纹模块 - 用于检测连续截图是否重复
+"""
+from typing import Union
+import io
+from PIL import Image, ImageChops, ImageStat
+
+# 指纹宽度，高度按原图比例缩放
+FINGERPRINT_WIDTH = 64
+
+
+def frame_fingerprint(frame: Union[bytes, Image.Image]) -> Image.Image:
+    """
+    计算帧指纹：缩小后的灰度图
+
+    缩小能过滤掉动画光标、抗锯齿等细微差异，同时把比较开销降到可以忽略。
+
+    Args:
+        frame: 截图的PNG字节数据或图片对象
+    """
+    if isinstance(frame, bytes):
+        frame = Image.open(io.BytesIO(frame))
+    with frame.convert('L') as gray:
+        height = max(1, round(gray.height * FINGERPRINT_WIDTH / gray.width))
+        return gray.resize((FINGERPRINT_WIDTH, height), Image.BOX)
+
+
+def frame_difference(a: Image.Image, b: Image.Image) -> float:
+    """
+    计算两个指纹的平均像素差(0-255)，尺寸不同时视为完全不同
+    """
+    if a.size != b.size:
+        return 255.0
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
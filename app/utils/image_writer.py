@@ -0,0 +1,628 @@
+"""
+图片写入模块 - 逐帧写出长截图，避免在内存中保留完整画布
+"""
+from typing import Optional, Tuple, Dict, Any, List
+import io
+import logging
+import os
+import struct
+import time
+import zlib
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# 各格式支持的最大边长；AVIF编码器上限为65536，但libavif解码默认拒绝超过32768的图片
+MAX_DIMENSIONS = {
+    'WEBP': 16383,
+    'JPEG': 65500,
+    'AVIF': 32768,
+}
+
+FILE_EXTENSIONS = {
+    'PNG': '.png',
+    'JPEG': '.jpg',
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+}
+
+
+def is_format_supported(image_format: str) -> bool:
+    """当前Pillow是否能编码该格式（AVIF需要Pillow 11.3+或pillow-avif-plugin）"""
+    Image.init()
+    return image_format in Image.SAVE
+
+
+def resolve_output_format(image_format: str, height: int) -> Tuple[str, Optional[int], Optional[str]]:
+    """
+    根据图片高度确定实际输出格式
+
+    Args:
+        image_format: 请求的输出格式
+        height: 图片高度
+
+    Returns:
+        (实际格式, 分段高度, 回退原因)，分段高度为None表示输出单张图片
+    """
+    image_format = image_format.upper()
+    if image_format == 'JPG':
+        image_format = 'JPEG'
+    if not is_format_supported(image_format):
+        return 'PNG', None, f"当前环境不支持{image_format}编码，回退为PNG"
+
+    max_height = MAX_DIMENSIONS.get(image_format)
+    if max_height is None or height <= max_height:
+        return image_format, None, None
+    if image_format != 'JPEG' and height <= MAX_DIMENSIONS['JPEG']:
+        return 'JPEG', None, f"高度{height}超出{image_format}限制{max_height}，回退为JPEG"
+    return image_format, max_height, f"高度{height}超出{image_format}限制{max_height}，按{max_height}px分段输出"
+
+
+def build_save_params(image_format: str, quality: int, lossless: bool = False, effort: int = 4,
+                      compress_level: int = 6) -> Dict[str, Any]:
+    """
+    构造Pillow保存参数
+
+    Args:
+        image_format: 实际输出格式
+        quality: 有损编码质量(1-100)
+        lossless: WebP/AVIF是否无损
+        effort: 编码耗时档位(0-6)
+        compress_level: PNG的zlib压缩级别(0-9)
+    """
+    if image_format == 'PNG':
+        return {'compress_level': compress_level}
+    if image_format == 'JPEG':
+        return {'quality': quality, 'optimize': effort >= 4}
+    if image_format == 'WEBP':
+        return {'quality': quality, 'method': effort, 'lossless': lossless}
+    if image_format == 'AVIF':
+        # AVIF的speed为0(最慢)到10(最快)
+        params = {'quality': 100 if lossless else quality, 'speed': round((6 - effort) * 10 / 6)}
+        if lossless:
+            params['subsampling'] = '4:4:4'
+        return params
+    return {}
+
+
+# 重新压缩PNG时每次最多解压出的字节数，限制高压缩比数据展开后的内存占用
+_RECOMPRESS_BLOCK_SIZE = 1024 * 1024
+
+
+def recompress_png(path: str, compress_level: int = 9, idat_chunk_size: int = 256 * 1024) -> Tuple[int, int]:
+    """
+    以更高的zlib压缩级别重新压缩PNG的图像数据并原子替换原文件
+
+    只把IDAT数据逐块解压再压缩，不解码像素，行过滤方式和其他数据块保持不变，
+    内存占用与图片大小无关。
+
+    Args:
+        path: PNG文件路径
+        compress_level: zlib压缩级别
+        idat_chunk_size: 输出的单个IDAT数据块大小
+
+    Returns:
+        重新压缩前后的文件大小
+    """
+    before = os.path.getsize(path)
+    temp_path = f"{path}.optimizing"
+    try:
+        with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+            if src.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                raise ValueError(f"不是PNG文件: {path}")
+            dst.write(PNG_SIGNATURE)
+            decompressor = zlib.decompressobj()
+            compressor = zlib.compressobj(compress_level)
+            pending = bytearray()
+            in_idat = False
+
+            def flush_idat(force: bool = False):
+                while len(pending) >= idat_chunk_size or (force and pending):
+                    dst.write(_png_chunk(b'IDAT', bytes(pending[:idat_chunk_size])))
+                    del pending[:idat_chunk_size]
+
+            while True:
+                header = src.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"PNG文件不完整: {path}")
+                length, chunk_type = struct.unpack('>I4s', header)
+                data = src.read(length)
+                src.read(4)
+                if chunk_type == b'IDAT':
+                    in_idat = True
+                    while data:
+                        pending += compressor.compress(decompressor.decompress(data, _RECOMPRESS_BLOCK_SIZE))
+                        data = decompressor.unconsumed_tail
+                        flush_idat()
+                    continue
+                if in_idat:
+                    # IDAT数据块结束，写出剩余的压缩数据
+                    while not decompressor.eof and (raw := decompressor.decompress(b'', _RECOMPRESS_BLOCK_SIZE)):
+                        pending += compressor.compress(raw)
+                    pending += compressor.flush()
+                    flush_idat(force=True)
+                    in_idat = False
+                dst.write(_png_chunk(chunk_type, data))
+                if chunk_type == b'IEND':
+                    break
+        after = os.path.getsize(temp_path)
+        if after < before:
+            os.replace(temp_path, path)
+        else:
+            os.remove(temp_path)
+            after = before
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return before, after
+
+
+# PNG行过滤类型
+PNG_FILTERS = {
+    'none': 0,
+    'sub': 1,
+    'up': 2,
+}
+
+# IHDR数据块中高度字段和CRC字段在文件中的偏移量
+_IHDR_HEIGHT_OFFSET = 8 + 8 + 4
+_IHDR_CRC_OFFSET = 8 + 8 + 13
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """构造一个PNG数据块"""
+    crc = zlib.crc32(chunk_type + data) & 0xFFFFFFFF
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', crc)
+
+
+def _ihdr_data(width: int, height: int) -> bytes:
+    """构造IHDR数据：8位深度、RGB、无隔行"""
+    return struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+
+class _TimedFile:
+    """
+    记录写盘耗时的输出文件
+
+    不提供fileno，Pillow会先编码到缓冲区再调用write，这样编码和写盘的耗时可以分开统计。
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'wb')
+        self.write_seconds = 0.0
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.write_seconds += time.perf_counter() - started
+
+    def write(self, data) -> int:
+        return self._timed(self._file.write, data)
+
+    def seek(self, *args) -> int:
+        # 缓冲区中的数据在seek时写出
+        return self._timed(self._file.seek, *args)
+
+    def flush(self):
+        self._timed(self._file.flush)
+
+    def close(self):
+        self._timed(self._file.close)
+
+    def fileno(self) -> int:
+        raise io.UnsupportedOperation("fileno")
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _save_image(image: Image.Image, path: str, image_format: str, save_params: Dict[str, Any]) -> float:
+    """
+    保存图片
+
+    Returns:
+        其中写盘的耗时（秒）
+    """
+    with _TimedFile(path) as f:
+        image.save(f, image_format, **save_params)
+    return f.write_seconds
+
+
+class StreamingPNGWriter:
+    """
+    流式PNG写入器
+
+    每写入一条图片就立即压缩成IDAT数据块落盘，总高度在写入完成后回填到IHDR中，
+    因此峰值内存约为一帧图片加上zlib缓冲区，与最终图片总高度无关。
+
+    行过滤使用固定类型（none/sub/up），由ImageChops按整条图片计算，
+    比Pillow逐行自适应选择过滤器快，压缩率略低。
+    """
+
+    def __init__(self, output_path: str, width: int, compress_level: int = 6,
+                 png_filter: str = 'none', idat_chunk_size: int = 256 * 1024):
+        if png_filter not in PNG_FILTERS:
+            raise ValueError(f"不支持的PNG过滤类型: {png_filter}")
+        self.output_path = output_path
+        self.width = width
+        self.height = 0
+        self.output_paths = [output_path]
+        self.idat_chunk_size = idat_chunk_size
+        self.png_filter = png_filter
+        self._filter_byte = bytes([PNG_FILTERS[png_filter]])
+        self._last_row: Optional[Image.Image] = None
+        self._stride = width * 3
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = bytearray()
+        # 内存中最大的一条图片，即峰值画布大小
+        self.peak_size = (width, 0)
+        self._file = _TimedFile(output_path)
+        self._file.write(PNG_SIGNATURE)
+        # 高度暂时写0，close时回填
+        self._file.write(_png_chunk(b'IHDR', _ihdr_data(width, 0)))
+
+    def write(self, image: Image.Image):
+        """
+        追加一条图片到输出末尾
+
+        Args:
+            image: 宽度必须与写入器宽度一致
+        """
+        if image.width != self.width:
+            raise ValueError(f"图片宽度({image.width})与输出宽度({self.width})不一致")
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        raw = memoryview(self._apply_filter(image).tobytes())
+        stride = self._stride
+        filter_byte = self._filter_byte
+        # 每行前加过滤类型字节
+        scanlines = b''.join(
+            filter_byte + raw[offset:offset + stride]
+            for offset in range(0, len(raw), stride)
+        )
+        self._pending += self._compressor.compress(scanlines)
+        self.height += image.height
+        if image.height > self.peak_size[1]:
+            self.peak_size = (self.width, image.height)
+        self._flush_idat()
+
+    def _apply_filter(self, image: Image.Image) -> Image.Image:
+        """计算整条图片的过滤结果（逐字节对256取模相减）"""
+        if self.png_filter == 'none':
+            return image
+
+        reference = Image.new('RGB', image.size)
+        if self.png_filter == 'sub':
+            # 每个像素减去左侧像素，RGB每像素3字节正好等于过滤器的bpp
+            reference.paste(image.crop((0, 0, image.width - 1, image.height)), (1, 0))
+        else:
+            # 每行减去上一行，第一行使用上一条图片的最后一行
+            if self._last_row is not None:
+                reference.paste(self._last_row, (0, 0))
+            reference.paste(image.crop((0, 0, image.width, image.height - 1)), (0, 1))
+            self._last_row = image.crop((0, image.height - 1, image.width, image.height))
+        return ImageChops.subtract_modulo(image, reference)
+
+    def _flush_idat(self, force: bool = False):
+        """将已压缩的数据按块写出"""
+        while len(self._pending) >= self.idat_chunk_size or (force and self._pending):
+            data = bytes(self._pending[:self.idat_chunk_size])
+            del self._pending[:self.idat_chunk_size]
+            self._file.write(_png_chunk(b'IDAT', data))
+
+    def close(self) -> Tuple[int, int]:
+        """
+        完成写入并回填图片高度
+
+        Returns:
+            最终图片的宽度和高度
+        """
+        if self._file.closed:
+            return self.width, self.height
+        try:
+            if self.height == 0:
+                raise ValueError("没有写入任何图片数据")
+            self._pending += self._compressor.flush()
+            self._flush_idat(force=True)
+            self._file.write(_png_chunk(b'IEND', b''))
+
+            # 回填IHDR中的高度和CRC
+            ihdr = _ihdr_data(self.width, self.height)
+            self._file.seek(_IHDR_HEIGHT_OFFSET)
+            self._file.write(struct.pack('>I', self.height))
+            self._file.seek(_IHDR_CRC_OFFSET)
+            self._file.write(struct.pack('>I', zlib.crc32(b'IHDR' + ihdr) & 0xFFFFFFFF))
+        finally:
+            self._file.close()
+        return self.width, self.height
+
+    @property
+    def write_seconds(self) -> float:
+        """写盘耗时（秒）"""
+        return self._file.write_seconds
+
+    def abort(self):
+        """放弃写入，关闭文件"""
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CanvasImageWriter:
+    """
+    画布写入器 - 在内存中拼接完整画布后一次性保存
+
+    用于无法流式编码的输出格式，height_hint为画布高度上限，
+    实际写入高度不足时在保存前裁剪。设置segment_height时超出部分按该高度分段保存。
+    """
+
+    def __init__(self, output_path: str, width: int, height_hint: int,
+                 image_format: str = 'PNG', segment_height: Optional[int] = None, **save_params):
+        self.output_path = output_path
+        self.width = width
+        self.height = 0
+        self.output_paths: List[str] = []
+        self.image_format = image_format
+        self.segment_height = segment_height
+        self.save_params = save_params
+        self.peak_size = (width, height_hint)
+        self.write_seconds = 0.0
+        self._canvas: Optional[Image.Image] = Image.new('RGB', (width, height_hint))
+
+    def write(self, image: Image.Image):
+        """追加一条图片到画布末尾"""
+        if image.width != self.width:
+            raise ValueError(f"图片宽度({image.width})与输出宽度({self.width})不一致")
+        if self.height + image.height > self._canvas.height:
+            raise ValueError("写入高度超出画布大小")
+        self._canvas.paste(image, (0, self.height))
+        self.height += image.height
+
+    def close(self) -> Tuple[int, int]:
+        """保存画布并释放内存"""
+        if self._canvas is None:
+            return self.width, self.height
+        try:
+            if self.height == 0:
+                raise ValueError("没有写入任何图片数据")
+            canvas = self._canvas
+            if self.height < canvas.height:
+                canvas = canvas.crop((0, 0, self.width, self.height))
+                self._canvas.close()
+            if self.segment_height and self.height > self.segment_height:
+                self._save_segments(canvas)
+            else:
+                self.write_seconds += _save_image(canvas, self.output_path, self.image_format, self.save_params)
+                self.output_paths = [self.output_path]
+            canvas.close()
+        finally:
+            self._canvas = None
+        return self.width, self.height
+
+    def _save_segments(self, canvas: Image.Image):
+        """按分段高度拆分保存"""
+        root, ext = os.path.splitext(self.output_path)
+        for index, top in enumerate(range(0, self.height, self.segment_height)):
+            bottom = min(top + self.segment_height, self.height)
+            segment_path = f"{root}_part{index + 1:02d}{ext}"
+            with canvas.crop((0, top, self.width, bottom)) as segment:
+                self.write_seconds += _save_image(segment, segment_path, self.image_format, self.save_params)
+            self.output_paths.append(segment_path)
+
+    def abort(self):
+        """放弃写入，释放画布"""
+        if self._canvas is not None:
+            self._canvas.close()
+            self._canvas = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ThumbnailWriter:
+    """
+    缩略图写入器 - 拼接时将每条图片缩放到目标宽度，避免之后重新解码大图
+    """
+
+    def __init__(self, output_path: str, source_width: int, target_width: int,
+                 image_format: str = 'JPEG', max_height: Optional[int] = None, **save_params):
+        self.output_path = output_path
+        self.width = min(target_width, source_width)
+        self.height = 0
+        # 缩略图高度上限（格式的最大边长），超出部分丢弃
+        self.max_height = max_height
+        self.image_format = image_format
+        self.save_params = save_params
+        self._scale = self.width / source_width
+        self.write_seconds = 0.0
+        self._strips: List[Image.Image] = []
+
+    def write(self, image: Image.Image):
+        """缩放并缓存一条图片"""
+        if self.max_height and self.height >= self.max_height:
+            return
+        strip_height = max(1, round(image.height * self._scale))
+        if self._scale == 1:
+            strip = image.copy()
+        else:
+            strip = image.resize((self.width, strip_height), Image.LANCZOS, reducing_gap=2.0)
+        if strip.mode != 'RGB':
+            strip = strip.convert('RGB')
+        if self.max_height and self.height + strip.height > self.max_height:
+            previous = strip
+            strip = previous.crop((0, 0, self.width, self.max_height - self.height))
+            previous.close()
+        self._strips.append(strip)
+        self.height += strip.height
+
+    def close(self) -> Tuple[int, int]:
+        """合并缩放后的图片并保存"""
+        if not self._strips:
+            return self.width, self.height
+        with Image.new('RGB', (self.width, self.height)) as thumbnail:
+            y_offset = 0
+            for strip in self._strips:
+                thumbnail.paste(strip, (0, y_offset))
+                y_offset += strip.height
+            self.write_seconds += _save_image(thumbnail, self.output_path, self.image_format, self.save_params)
+        self.abort()
+        return self.width, self.height
+
+    def abort(self):
+        """释放缓存的图片"""
+        for strip in self._strips:
+            strip.close()
+        self._strips = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class PreviewWriter:
+    """
+    预览图写入器 - 保留拼接结果顶部的max_height像素，超出部分直接丢弃
+    """
+
+    def __init__(self, output_path: str, width: int, max_height: int,
+                 image_format: str = 'JPEG', **save_params):
+        self.output_path = output_path
+        self.width = width
+        self.height = 0
+        self.max_height = max_height
+        self.image_format = image_format
+        self.save_params = save_params
+        self.write_seconds = 0.0
+        self._canvas: Optional[Image.Image] = Image.new('RGB', (width, max_height))
+
+    def write(self, image: Image.Image):
+        """写入图片中仍位于预览范围内的部分"""
+        remaining = self.max_height - self.height
+        if remaining <= 0:
+            return
+        if image.height > remaining:
+            with image.crop((0, 0, image.width, remaining)) as part:
+                self._canvas.paste(part, (0, self.height))
+            self.height += remaining
+        else:
+            self._canvas.paste(image, (0, self.height))
+            self.height += image.height
+
+    def close(self) -> Tuple[int, int]:
+        """保存预览图"""
+        if self._canvas is None:
+            return self.width, self.height
+        try:
+            if self.height == 0:
+                raise ValueError("没有写入任何图片数据")
+            if self.height < self.max_height:
+                with self._canvas.crop((0, 0, self.width, self.height)) as preview:
+                    self.write_seconds += _save_image(preview, self.output_path, self.image_format,
+                                                      self.save_params)
+            else:
+                self.write_seconds += _save_image(self._canvas, self.output_path, self.image_format,
+                                                  self.save_params)
+        finally:
+            self.abort()
+        return self.width, self.height
+
+    def abort(self):
+        """释放画布"""
+        if self._canvas is not None:
+            self._canvas.close()
+            self._canvas = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class OptionalOutputWriter:
+    """
+    附加输出包装器 - 缩略图、预览图等附加输出出错时只记录日志并放弃该输出，不影响主输出
+    """
+
+    def __init__(self, writer, name: str):
+        self.writer = writer
+        self.name = name
+        self.failed = False
+
+    @property
+    def output_path(self) -> str:
+        return self.writer.output_path
+
+    @property
+    def write_seconds(self) -> float:
+        return self.writer.write_seconds
+
+    def _fail(self, error: Exception):
+        """放弃该输出，释放内存并删除写了一半的文件"""
+        logger.warning(f"{self.name}生成失败，已放弃: {error}")
+        self.failed = True
+        self.writer.abort()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+    def write(self, image: Image.Image):
+        if self.failed:
+            return
+        try:
+            self.writer.write(image)
+        except Exception as e:
+            self._fail(e)
+
+    def close(self) -> Tuple[int, int]:
+        if not self.failed:
+            try:
+                return self.writer.close()
+            except Exception as e:
+                self._fail(e)
+        return self.writer.width, self.writer.height
+
+    def abort(self):
+        self.writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
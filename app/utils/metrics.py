@@ -0,0 +1,157 @@
+"""
+指标模块 - Prometheus指标定义和截图阶段计时
+"""
+from typing import Dict, List, Optional, Any
+import asyncio
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from app.utils.tracing import tracer, Span
+
+# 阶段耗时分桶（秒），覆盖从单帧截图到整页加载的范围
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+CAPTURE_STAGE_SECONDS = Histogram(
+    "douyin_capture_stage_seconds",
+    "长截图各阶段耗时（秒），frame为单帧截图",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+CAPTURE_SECONDS = Histogram(
+    "douyin_capture_seconds",
+    "长截图总耗时（秒）",
+    buckets=STAGE_BUCKETS + (180.0, 300.0)
+)
+CAPTURES_TOTAL = Counter(
+    "douyin_captures_total",
+    "长截图次数，按结果分类(success/failure/timeout/cancelled)",
+    ["outcome"]
+)
+CACHE_LOOKUPS_TOTAL = Counter(
+    "douyin_cache_lookups_total",
+    "结果缓存查询次数(hit/miss)",
+    ["result"]
+)
+ADMISSION_REJECTED_TOTAL = Counter(
+    "douyin_admission_rejected_total",
+    "排队已满被拒绝的请求数"
+)
+
+# 以下仪表在采集时由回调函数取值，见app/api/metrics.py
+BROWSER_OPEN_PAGES = Gauge("douyin_browser_open_pages", "浏览器中打开的页面数")
+BROWSER_CONTEXTS = Gauge("douyin_browser_contexts", "浏览器上下文数")
+CAPTURES_IN_FLIGHT = Gauge("douyin_captures_in_flight", "正在执行的截图数")
+CAPTURE_QUEUE_DEPTH = Gauge("douyin_capture_queue_depth", "排队等待执行的截图数")
+JOB_QUEUE_DEPTH = Gauge("douyin_job_queue_depth", "排队中的异步任务数")
+
+
+class _StageContext:
+    """单个阶段的计时上下文和追踪span，可以用作同步或异步上下文管理器"""
+
+    def __init__(self, timer: "StageTimer", name: str, attributes: Dict[str, Any]):
+        self._timer = timer
+        self._name = name
+        self._attributes = attributes
+        self._start = 0.0
+        self.span: Span = Span()
+
+    def set_attribute(self, key: str, value: Any):
+        self.span.set_attribute(key, value)
+
+    def __enter__(self):
+        self.span = tracer.start_span(f"capture.{self._name}", **self._attributes)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._timer.add(self._name, time.perf_counter() - self._start)
+        if exc is not None:
+            self.span.record_error(exc)
+        self.span.end()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc_info):
+        return self.__exit__(*exc_info)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+class StageTimer:
+    """
+    记录一次截图各阶段的耗时和资源用量
+
+    每次计时都上报到阶段直方图，同一阶段多次计时的耗时累加到durations，每次的耗时保留在samples中。
+    指定span_name时整个截图是一个追踪span，各阶段是它的子span。
+    """
+
+    def __init__(self, span_name: Optional[str] = None, **attributes):
+        self.started_at = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.samples: Dict[str, List[float]] = {}
+        # 资源用量（帧数、下载字节数、峰值画布等），随结果一起返回
+        self.resources: Dict[str, Any] = {}
+        self.span: Span = tracer.start_span(span_name, **attributes) if span_name else Span()
+
+    def stage(self, name: str, **attributes) -> _StageContext:
+        """对代码块计时，并在子span中执行"""
+        return _StageContext(self, name, attributes)
+
+    def add(self, name: str, seconds: float, observe: bool = True):
+        """
+        记录在别处测得的耗时（例如线程池中的编码耗时）
+
+        Args:
+            name: 阶段名称
+            seconds: 耗时（秒）
+            observe: 是否上报到阶段直方图
+        """
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.samples.setdefault(name, []).append(seconds)
+        if observe:
+            CAPTURE_STAGE_SECONDS.labels(name).observe(seconds)
+
+    async def wait(self, seconds: float):
+        """固定等待（等待渲染、滚动动画等），耗时累加到waits，不上报直方图"""
+        started = time.perf_counter()
+        await asyncio.sleep(seconds)
+        self.add("waits", time.perf_counter() - started, observe=False)
+
+    def timings(self) -> Dict[str, Any]:
+        """
+        各阶段耗时（毫秒），frame_ms为每一帧截图的耗时列表
+
+        Returns:
+            {"total_ms": ..., "<阶段>_ms": ..., "frame_ms": [...]}
+        """
+        timings: Dict[str, Any] = {"total_ms": _ms(time.perf_counter() - self.started_at)}
+        for name, seconds in self.durations.items():
+            if name == "frame":
+                timings["frame_ms"] = [_ms(sample) for sample in self.samples[name]]
+            else:
+                timings[f"{name}_ms"] = _ms(seconds)
+        return timings
+
+    def finish(self, outcome: str, error: Optional[BaseException] = None, **attributes) -> float:
+        """
+        记录截图结果和总耗时，结束整体span
+
+        Args:
+            outcome: success/failure/timeout/cancelled
+            error: 失败原因
+            attributes: 附加到整体span的属性（帧数、字节数等）
+
+        Returns:
+            总耗时（秒）
+        """
+        elapsed = time.perf_counter() - self.started_at
+        CAPTURES_TOTAL.labels(outcome).inc()
+        CAPTURE_SECONDS.observe(elapsed)
+        self.span.set_attributes({"capture.outcome": outcome, **attributes})
+        if error is not None:
+            self.span.record_error(error)
+        self.span.end()
+        return elapsed
@@ -0,0 +1,262 @@
+"""
+瓦片金字塔模块 - 为超长截图生成Deep Zoom(DZI)格式的多级瓦片
+"""
+from typing import Optional, Dict, Any, List, Tuple
+import json
+import logging
+import math
+import os
+import shutil
+from PIL import Image
+from app.utils.image_writer import FILE_EXTENSIONS, build_save_params, _save_image
+
+logger = logging.getLogger(__name__)
+
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+
+
+def _tile_bounds(index: int, tile_size: int, overlap: int, limit: int) -> Tuple[int, int]:
+    """计算瓦片在某一方向上的起止坐标（含重叠区域）"""
+    start = index * tile_size - (overlap if index > 0 else 0)
+    end = min((index + 1) * tile_size + overlap, limit)
+    return start, end
+
+
+class _TileLevel:
+    """
+    金字塔中的一级：缓存还没有切成瓦片的行，并把缩小一半的行交给下一级
+
+    index为相对原图的缩小次数，DZI的级别号要等全部行写完、知道总级数后才能确定，
+    因此瓦片先写入临时目录 _{index}，结束时再改名。
+    """
+
+    def __init__(self, writer: "TilePyramidWriter", index: int, width: int):
+        self.writer = writer
+        self.index = index
+        self.width = width
+        self.height = 0
+        self.columns = math.ceil(width / writer.tile_size)
+        self.rows = 0
+        self.directory = os.path.join(writer.tiles_dir, f"_{index}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.next: Optional["_TileLevel"] = None
+        # 缓存中第一行在本级中的纵坐标
+        self._buffer_top = 0
+        self._buffer: Optional[Image.Image] = None
+        # 缩小时凑不成两行、留到下一次的一行
+        self._carry: Optional[Image.Image] = None
+
+    def write(self, image: Image.Image):
+        """追加一条图片，切出已经完整的瓦片行，并把缩小后的图片交给下一级"""
+        self._buffer = _append_rows(self._buffer, image)
+        self.height += image.height
+        tile_size, overlap = self.writer.tile_size, self.writer.overlap
+        while self.height >= (self.rows + 1) * tile_size + overlap:
+            self._cut_row()
+        # 丢弃之后的瓦片行不再用到的缓存行
+        keep_from = self.rows * tile_size - overlap
+        if self.rows and keep_from > self._buffer_top:
+            previous = self._buffer
+            self._buffer = previous.crop((0, keep_from - self._buffer_top, self.width, previous.height))
+            self._buffer_top = keep_from
+            previous.close()
+        self._downscale(image)
+
+    def finish(self):
+        """切出剩余的瓦片行，再依次结束下一级，直到缩小为1x1像素"""
+        while self.rows * self.writer.tile_size < self.height:
+            self._cut_row()
+        self.abort_buffers(carry=False)
+        if max(self.width, self.height) <= 1:
+            return
+        if self._carry is not None:
+            carry, self._carry = self._carry, None
+            with carry:
+                self._forward(carry.resize((math.ceil(self.width / 2), 1), Image.BOX))
+        self.next.finish()
+
+    def _cut_row(self):
+        """按DZI的坐标规则切出一行瓦片（含重叠区域）"""
+        tile_size, overlap = self.writer.tile_size, self.writer.overlap
+        top, bottom = _tile_bounds(self.rows, tile_size, overlap, self.height)
+        for col in range(self.columns):
+            left, right = _tile_bounds(col, tile_size, overlap, self.width)
+            with self._buffer.crop((left, top - self._buffer_top, right, bottom - self._buffer_top)) as tile:
+                self.writer.save_tile(tile, os.path.join(self.directory, f"{col}_{self.rows}"))
+        self.rows += 1
+
+    def _downscale(self, image: Image.Image):
+        """每两行缩小为一行交给下一级，BOX滤波在2倍缩小时等价于2x2均值；奇数行时最后一行留到下一次"""
+        rows = image
+        if self._carry is not None:
+            rows = _append_rows(self._carry, image)
+            self._carry = None
+        even = rows.height // 2 * 2
+        try:
+            if even < rows.height:
+                self._carry = rows.crop((0, even, self.width, rows.height))
+            if even:
+                self._forward(rows.resize((math.ceil(self.width / 2), even // 2), Image.BOX,
+                                          box=(0, 0, self.width, even)))
+        finally:
+            if rows is not image:
+                rows.close()
+
+    def _forward(self, image: Image.Image):
+        """将缩小后的图片写入下一级，需要时创建下一级"""
+        with image:
+            if self.next is None:
+                self.next = self.writer.add_level(image.width)
+            self.next.write(image)
+
+    def abort_buffers(self, carry: bool = True):
+        """释放缓存的图片"""
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        if carry and self._carry is not None:
+            self._carry.close()
+            self._carry = None
+
+
+def _append_rows(top: Optional[Image.Image], bottom: Image.Image) -> Image.Image:
+    """将bottom接在top下方返回新图片，并关闭top"""
+    if top is None:
+        return bottom.copy()
+    combined = Image.new('RGB', (top.width, top.height + bottom.height))
+    combined.paste(top, (0, 0))
+    combined.paste(bottom, (0, top.height))
+    top.close()
+    return combined
+
+
+class TilePyramidWriter:
+    """
+    瓦片金字塔写入器 - 拼接时逐条切出DZI瓦片，避免之后重新解码完整的输出图片
+
+    每一级只缓存不足一行瓦片的图片，下一级由本级的图片逐条缩小一半得到，
+    内存占用与图片总高度无关。瓦片路径为 {name}_files/{level}/{col}_{row}.{ext}，与DZI和XYZ查看器兼容。
+    """
+
+    def __init__(self, output_dir: str, name: str, width: int, tile_size: int = 256,
+                 overlap: int = 1, tile_format: str = 'JPEG', quality: int = 90):
+        """
+        Args:
+            output_dir: 输出目录
+            name: 输出文件名前缀
+            width: 图片宽度
+            tile_size: 瓦片边长
+            overlap: 相邻瓦片重叠像素
+            tile_format: 瓦片格式(JPEG/PNG/WEBP)
+            quality: 有损格式的编码质量
+        """
+        self.output_dir = output_dir
+        self.name = name
+        self.width = width
+        self.height = 0
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tile_format = tile_format.upper()
+        self.extension = FILE_EXTENSIONS[self.tile_format]
+        self.save_params = build_save_params(self.tile_format, quality)
+        self.tiles_dir = os.path.join(output_dir, f"{name}_files")
+        self.tile_count = 0
+        self.write_seconds = 0.0
+        # 关闭后的清单信息，包括各级尺寸和文件路径
+        self.result: Optional[Dict[str, Any]] = None
+        self._levels: List[_TileLevel] = []
+        # 与输出文件一样覆盖同名的旧瓦片，否则结束时无法将临时目录改名为级别号
+        shutil.rmtree(self.tiles_dir, ignore_errors=True)
+        self.add_level(width)
+
+    def add_level(self, width: int) -> _TileLevel:
+        """创建下一级（比上一级缩小一半）"""
+        level = _TileLevel(self, len(self._levels), width)
+        self._levels.append(level)
+        return level
+
+    def save_tile(self, tile: Image.Image, path_stem: str):
+        self.write_seconds += _save_image(tile, path_stem + self.extension, self.tile_format, self.save_params)
+        self.tile_count += 1
+
+    def write(self, image: Image.Image):
+        """追加一条图片到原图底部"""
+        if image.width != self.width:
+            raise ValueError(f"图片宽度({image.width})与输出宽度({self.width})不一致")
+        if image.mode != 'RGB':
+            with image.convert('RGB') as converted:
+                self._levels[0].write(converted)
+        else:
+            self._levels[0].write(image)
+        self.height += image.height
+
+    def close(self) -> Tuple[int, int]:
+        """切出剩余瓦片，确定各级的级别号，写出DZI描述文件和JSON清单"""
+        if self.result is not None:
+            return self.width, self.height
+        if self.height == 0:
+            raise ValueError("没有写入任何图片数据")
+        self._levels[0].finish()
+
+        max_level = len(self._levels) - 1
+        levels = []
+        for level in self._levels:
+            number = max_level - level.index
+            os.replace(level.directory, os.path.join(self.tiles_dir, str(number)))
+            levels.append({
+                "level": number,
+                "width": level.width,
+                "height": level.height,
+                "columns": level.columns,
+                "rows": level.rows
+            })
+
+        dzi_path = os.path.join(self.output_dir, f"{self.name}.dzi")
+        with open(dzi_path, 'w', encoding='utf-8') as f:
+            f.write(
+                f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="{DZI_NAMESPACE}" Format="{self.extension[1:]}" Overlap="{self.overlap}" '
+                f'TileSize="{self.tile_size}">\n'
+                f'  <Size Width="{self.width}" Height="{self.height}"/>\n'
+                f'</Image>\n'
+            )
+
+        manifest = {
+            "width": self.width,
+            "height": self.height,
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "format": self.extension[1:],
+            "max_level": max_level,
+            "tile_url_template": f"{self.name}_files/{{level}}/{{col}}_{{row}}{self.extension}",
+            "levels": sorted(levels, key=lambda item: item["level"]),
+        }
+        manifest_path = os.path.join(self.output_dir, f"{self.name}.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"瓦片金字塔生成完成: {max_level + 1} 级, {self.tile_count} 张瓦片")
+        self.result = {
+            "manifest_path": manifest_path,
+            "dzi_path": dzi_path,
+            "tiles_dir": self.tiles_dir,
+            "levels": max_level + 1,
+            "tile_count": self.tile_count
+        }
+        return self.width, self.height
+
+    def abort(self):
+        """放弃写入，释放缓存并删除已写出的瓦片"""
+        for level in self._levels:
+            level.abort_buffers()
+        self._levels = []
+        shutil.rmtree(self.tiles_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,213 @@
+"""
+追踪模块 - 为截图各阶段生成span
+
+安装了opentelemetry-sdk和OTLP导出器时可以导出到本地collector（TRACING_EXPORTER=otlp）；
+否则使用内置实现，把span以JSON行写入文件（TRACING_EXPORTER=json），字段与OpenTelemetry保持一致。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterator
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = "douyin-screenshot"
+
+try:
+    from opentelemetry import trace as otel_trace, context as otel_context
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # pragma: no cover - opentelemetry是可选依赖
+    otel_trace = None
+
+
+class Span:
+    """span的统一接口，未启用追踪时所有操作都是空操作"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+class _OtelSpan(Span):
+    """OpenTelemetry span，创建时设为当前span"""
+
+    def __init__(self, tracer, name: str, attributes: Dict[str, Any]):
+        self._span = tracer.start_span(name, attributes=_clean(attributes))
+        self._token = otel_context.attach(otel_trace.set_span_in_context(self._span))
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self._span.set_attribute(key, value)
+
+    def record_error(self, error: BaseException):
+        self._span.record_exception(error)
+        self._span.set_status(Status(StatusCode.ERROR, str(error)))
+
+    def end(self):
+        otel_context.detach(self._token)
+        self._span.end()
+
+
+# 内置实现的当前span
+_current_span: ContextVar[Optional["_JsonSpan"]] = ContextVar("current_span", default=None)
+
+
+class _JsonSpan(Span):
+    """内置span，结束时写入JSON行文件"""
+
+    def __init__(self, exporter: "JsonFileExporter", name: str, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        self._exporter = exporter
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = _clean(attributes)
+        self.status = "OK"
+        self.error: Optional[str] = None
+        self.start_time = time.time_ns()
+        self._token = _current_span.set(self)
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "ERROR"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        end_time = time.time_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 在其他上下文中结束时无法恢复父span，只导出
+            pass
+        self._exporter.export({
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_time,
+            "end_time_unix_nano": end_time,
+            "duration_ms": round((end_time - self.start_time) / 1e6, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        })
+
+
+class JsonFileExporter:
+    """把span以JSON行追加到文件，多线程安全"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"写入追踪文件失败: {e}")
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉值为None的属性（OpenTelemetry不接受None）"""
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+class Tracer:
+    def __init__(self):
+        self.exporter = "none"
+        self._otel_tracer = None
+        self._json_exporter: Optional[JsonFileExporter] = None
+
+    def configure(self, exporter: str, trace_file: str = "./logs/traces.jsonl",
+                  otlp_endpoint: Optional[str] = None, service_name: str = TRACER_NAME):
+        """
+        配置导出方式
+
+        Args:
+            exporter: none（不追踪）、json（写入trace_file）、otlp（导出到collector）
+                或otel（使用进程中已配置的OpenTelemetry，例如opentelemetry-instrument启动时）
+            trace_file: json导出的文件路径
+            otlp_endpoint: OTLP/HTTP地址，默认使用OTEL_EXPORTER_OTLP_ENDPOINT环境变量
+            service_name: 上报的服务名
+        """
+        exporter = exporter.lower()
+        if exporter in ("otlp", "otel") and otel_trace is None:
+            logger.warning("未安装opentelemetry，追踪改为写入JSON文件")
+            exporter = "json"
+        if exporter == "otlp":
+            try:
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            except ImportError:
+                logger.warning("未安装opentelemetry-sdk或OTLP导出器，追踪改为写入JSON文件")
+                exporter = "json"
+            else:
+                provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+                span_exporter = OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter()
+                provider.add_span_processor(BatchSpanProcessor(span_exporter))
+                otel_trace.set_tracer_provider(provider)
+
+        self.exporter = exporter
+        self._otel_tracer = otel_trace.get_tracer(TRACER_NAME) if exporter in ("otlp", "otel") else None
+        self._json_exporter = JsonFileExporter(trace_file) if exporter == "json" else None
+        if exporter != "none":
+            logger.info(f"已启用追踪: {exporter}")
+
+    def shutdown(self):
+        """刷新并关闭OpenTelemetry导出器"""
+        if self.exporter == "otlp":
+            provider = otel_trace.get_tracer_provider()
+            if hasattr(provider, "shutdown"):
+                provider.shutdown()
+
+    def start_span(self, name: str, **attributes) -> Span:
+        """
+        创建span并设为当前span，调用方负责调用end
+
+        必须在创建span的同一个任务中结束，以便恢复父span。
+        """
+        if self._otel_tracer is not None:
+            return _OtelSpan(self._otel_tracer, name, attributes)
+        if self._json_exporter is not None:
+            return _JsonSpan(self._json_exporter, name, attributes)
+        return Span()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """在span中执行代码块，出错时记录异常"""
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.end()
+
+# 全局追踪器
+tracer = Tracer()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+长截图基准测试 - 对本地合成页面按不同截图模式执行长截图，统计耗时、帧数、CPU和内存
+
+直接调用playwright_service.take_long_screenshot，不经过结果缓存和准入控制。
+浏览器CPU和内存需要安装psutil（pip install psutil），否则只统计本进程。
+
+用法:
+    python -m benchmarks.capture_benchmark
+    python -m benchmarks.capture_benchmark --modes png,webp --iterations 5 --items 120 --json results/capture.json
+"""
+from typing import Optional, Dict, Any, List
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+from app.core.config import settings
+from app.models.douyin import LongScreenshotOptions
+from app.services.playwright_service import playwright_service
+from benchmarks.common import ResourceSampler, summarize, print_table, write_json, psutil
+from benchmarks.synthetic_page import start_server, page_url
+
+# 截图模式：长截图选项和需要临时修改的配置
+MODES: Dict[str, Dict[str, Any]] = {
+    "png": {"options": {}},
+    "png_canvas": {"options": {}, "settings": {"stream_png_output": False}},
+    "png_fast": {"options": {"png_compress_level": 1}},
+    "jpeg": {"options": {"output_format": "jpeg"}},
+    "webp": {"options": {"output_format": "webp"}},
+    "trim": {"options": {"trim_blank": True}},
+    "thumbnail": {"options": {"thumbnail_width": 390, "preview_height": 2000}},
+    "tiles": {"options": {"tiles": True}},
+}
+
+# 输出的阶段耗时（取中位数）
+STAGES = ("navigation_ms", "preload_ms", "frames_ms", "stitch_ms", "encode_ms", "write_ms")
+
+
+async def run_capture(url: str, mode: str, output_dir: str) -> Dict[str, Any]:
+    """执行一次长截图并采样资源"""
+    config = MODES[mode]
+    overrides = config.get("settings", {})
+    previous = {key: getattr(settings, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+
+    sampler = ResourceSampler()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        result = await playwright_service.take_long_screenshot(
+            url, output_dir=output_dir, options=LongScreenshotOptions(**config["options"])
+        )
+    finally:
+        latency = time.perf_counter() - started
+        resources = sampler.stop()
+        for key, value in previous.items():
+            setattr(settings, key, value)
+
+    return {
+        "success": result.get("success", False),
+        "error": result.get("error"),
+        "latency": latency,
+        "frames": result.get("screenshot_count"),
+        "file_size": result.get("file_size"),
+        "timings": result.get("timings", {}),
+        "resources": result.get("resources", {}),
+        **resources
+    }
+
+
+def aggregate(mode: str, runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总同一模式的多次运行：耗时取百分位数，其余取中位数，内存取峰值"""
+    succeeded = [run for run in runs if run["success"]]
+    latency = summarize([run["latency"] for run in succeeded])
+
+    def median(key: str, section: Optional[str] = None):
+        values = [(run[section] if section else run).get(key) for run in succeeded]
+        values = [value for value in values if value is not None]
+        return statistics.median(values) if values else None
+
+    def peak(key: str):
+        values = [run[key] for run in succeeded if run[key] is not None]
+        return max(values) if values else None
+
+    file_size = median("file_size")
+    return {
+        "mode": mode,
+        "runs": len(runs),
+        "errors": len(runs) - len(succeeded),
+        "latency": latency,
+        "latency_p50": latency["p50"],
+        "latency_p95": latency["p95"],
+        "frames": median("frames"),
+        "file_kb": round(file_size / 1024, 1) if file_size is not None else None,
+        "cpu_s": median("cpu_seconds"),
+        "browser_cpu_s": median("browser_cpu_seconds"),
+        "peak_rss_mb": peak("peak_rss_mb"),
+        "peak_browser_mb": peak("peak_browser_rss_mb"),
+        "bytes_downloaded": median("bytes_downloaded", "resources"),
+        **{stage: median(stage, "timings") for stage in STAGES},
+        "error_messages": [run["error"] for run in runs if not run["success"]],
+    }
+
+
+async def run_benchmark(args) -> List[Dict[str, Any]]:
+    server, base_url = start_server()
+    url = page_url(base_url, items=args.items, image_every=args.image_every,
+                   image_delay=args.image_delay, hydrate_ms=args.hydrate_ms)
+    print(f"合成页面: {url}")
+    if psutil is None:
+        print("未安装psutil，浏览器CPU和内存不统计")
+
+    if not await playwright_service.initialize():
+        server.shutdown()
+        raise SystemExit("浏览器初始化失败，请先执行 playwright install firefox")
+
+    summaries = []
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = args.output_dir or temp_dir
+            for mode in args.modes:
+                for _ in range(args.warmup):
+                    await run_capture(url, mode, output_dir)
+                runs = []
+                for index in range(args.iterations):
+                    run = await run_capture(url, mode, output_dir)
+                    print(f"[{mode}] 第 {index + 1}/{args.iterations} 次: "
+                          f"{'成功' if run['success'] else '失败'}, {run['latency']:.2f}s, {run['frames']} 帧")
+                    runs.append(run)
+                summaries.append(aggregate(mode, runs))
+    finally:
+        await playwright_service.close()
+        server.shutdown()
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长截图基准测试")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"逗号分隔的截图模式，可选: {', '.join(MODES)}")
+    parser.add_argument("--iterations", type=int, default=3, help="每种模式的测量次数")
+    parser.add_argument("--warmup", type=int, default=1, help="每种模式的预热次数（不计入结果）")
+    parser.add_argument("--items", type=int, default=40, help="合成页面内容条数（页面长度）")
+    parser.add_argument("--image-every", type=int, default=1, help="每隔几条内容插入一张懒加载图片")
+    parser.add_argument("--image-delay", type=int, default=0, help="图片响应延迟（毫秒）")
+    parser.add_argument("--hydrate-ms", type=int, default=300, help="页面渲染延迟（毫秒）")
+    parser.add_argument("--output-dir", help="保留截图的目录，默认使用临时目录")
+    parser.add_argument("--json", help="结果保存路径")
+    args = parser.parse_args()
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"未知的截图模式: {', '.join(unknown)}")
+
+    logging.basicConfig(level=logging.WARNING)
+    summaries = asyncio.run(run_benchmark(args))
+
+    print()
+    print_table(summaries, ["mode", "runs", "errors", "latency_p50", "latency_p95", "frames", "file_kb",
+                            "cpu_s", "browser_cpu_s", "peak_rss_mb", "peak_browser_mb", *STAGES])
+    if args.json:
+        write_json(args.json, {"args": vars(args), "results": summaries})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+基准测试公共工具 - 资源采样、统计和结果输出
+
+安装psutil时统计目标进程和浏览器子进程的CPU与内存；未安装时只统计本进程。
+"""
+from typing import Optional, Dict, Any, List, Sequence
+import json
+import os
+import resource
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # psutil是可选依赖
+    psutil = None
+
+MB = 1024 * 1024
+
+
+def _self_rss() -> Optional[int]:
+    """本进程当前RSS（字节）"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class ResourceSampler:
+    """
+    在后台线程中定期采样内存，结束时汇总CPU时间和峰值内存
+
+    默认采样本进程，指定pid时采样该进程（例如单独启动的服务进程）；浏览器指目标进程的全部子进程。
+
+    用法:
+        sampler = ResourceSampler()
+        sampler.start()
+        ...
+        summary = sampler.stop()
+    """
+
+    def __init__(self, interval: float = 0.2, pid: Optional[int] = None):
+        self.interval = interval
+        self.pid = pid
+        # 每次采样：相对开始时间（秒）、目标进程RSS、浏览器RSS（MB）
+        self.samples: List[Dict[str, Optional[float]]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._cpu_start: Optional[float] = None
+        self._child_cpu_start: Dict[int, float] = {}
+
+    def _rss(self) -> Optional[int]:
+        if self.pid is None:
+            return _self_rss()
+        if psutil is None:
+            return None
+        try:
+            return psutil.Process(self.pid).memory_info().rss
+        except psutil.Error:
+            return None
+
+    def _cpu(self) -> Optional[float]:
+        if self.pid is None:
+            return time.process_time()
+        if psutil is None:
+            return None
+        try:
+            times = psutil.Process(self.pid).cpu_times()
+            return times.user + times.system
+        except psutil.Error:
+            return None
+
+    def _children(self) -> List[Any]:
+        try:
+            return psutil.Process(self.pid).children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _child_cpu(self) -> Dict[int, float]:
+        cpu = {}
+        for child in self._children():
+            try:
+                times = child.cpu_times()
+                cpu[child.pid] = times.user + times.system
+            except psutil.Error:
+                pass
+        return cpu
+
+    def _sample(self):
+        rss = self._rss()
+        browser_rss = None
+        if psutil is not None:
+            browser_rss = 0
+            for child in self._children():
+                try:
+                    browser_rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+        self.samples.append({
+            "t": round(time.perf_counter() - self._started_at, 3),
+            "rss_mb": round(rss / MB, 1) if rss is not None else None,
+            "browser_rss_mb": round(browser_rss / MB, 1) if browser_rss is not None else None,
+        })
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.samples = []
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._cpu_start = self._cpu()
+        if psutil is not None:
+            self._child_cpu_start = self._child_cpu()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        """
+        停止采样
+
+        Returns:
+            cpu_seconds（目标进程）、browser_cpu_seconds、peak_rss_mb、peak_browser_rss_mb，
+            无法统计的字段（例如未安装psutil时的浏览器数据）为None
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._sample()
+        cpu_end = self._cpu()
+        browser_cpu = None
+        if psutil is not None:
+            browser_cpu = sum(
+                seconds - self._child_cpu_start.get(pid, 0.0)
+                for pid, seconds in self._child_cpu().items()
+            )
+        rss = [sample["rss_mb"] for sample in self.samples if sample["rss_mb"] is not None]
+        browser_rss = [sample["browser_rss_mb"] for sample in self.samples if sample["browser_rss_mb"] is not None]
+        return {
+            "cpu_seconds": round(cpu_end - self._cpu_start, 3)
+            if cpu_end is not None and self._cpu_start is not None else None,
+            "browser_cpu_seconds": round(browser_cpu, 3) if browser_cpu is not None else None,
+            "peak_rss_mb": max(rss) if rss else None,
+            "peak_browser_rss_mb": max(browser_rss) if browser_rss else None,
+        }
+
+
+def max_rss_mb() -> float:
+    """本进程历史峰值RSS（MB），Linux上ru_maxrss单位为KB，macOS上为字节"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (MB if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """线性插值的百分位数，q取0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """最小值、中位数、p95、p99和最大值"""
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+
+    return {
+        "min": rounded(min(values)) if values else None,
+        "p50": rounded(percentile(values, 50)),
+        "p95": rounded(percentile(values, 95)),
+        "p99": rounded(percentile(values, 99)),
+        "max": rounded(max(values)) if values else None,
+    }
+
+
+def print_table(rows: List[Dict[str, Any]], columns: Sequence[str]):
+    """按列输出对齐的结果表格，缺失值显示为-"""
+    def cell(value):
+        if value is None:
+            return "-"
+        if isinstance(value, float):
+            return f"{value:.3f}".rstrip("0").rstrip(".")
+        return str(value)
+
+    table = [list(columns)] + [[cell(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(line[index]) for line in table) for index in range(len(columns))]
+    for index, line in enumerate(table):
+        print("  ".join(value.rjust(width) for value, width in zip(line, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+
+
+def write_json(path: str, data: Any):
+    """保存结果，便于比较优化前后的数据"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {path}")
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+压力测试 - 以指定并发数或到达速率调用长截图接口，统计吞吐量、耗时百分位数、错误率和内存变化
+
+默认在子进程中启动服务（python -m uvicorn app.main:app），截图目标是本地合成页面；
+也可以用--base-url压测已经运行的服务（此时合成页面必须能被该服务访问）。
+服务的配置（MAX_INFLIGHT_CAPTURES等）通过环境变量传入子进程。
+内存变化需要安装psutil，只对子进程启动的服务统计。
+
+两种压测方式：
+- 闭环（--concurrency 1,2,4）：每个级别固定数量的客户端，收到响应后立即发送下一个请求
+- 开环（--rate 0.5,1,2）：每个级别按固定速率（或--arrival poisson为泊松过程）发送请求，不等待响应
+
+用法:
+    python -m benchmarks.load_test --concurrency 1,2,4,8 --duration 120
+    MAX_INFLIGHT_CAPTURES=4 python -m benchmarks.load_test --rate 0.2,0.5,1 --duration 300 --json results/load.json
+"""
+from collections import Counter
+from typing import Optional, Dict, Any, List
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.common import ResourceSampler, summarize, print_table, write_json, psutil
+from benchmarks.synthetic_page import start_server, page_url
+
+SERVICE_STARTUP_TIMEOUT = 120.0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServiceProcess:
+    """在子进程中运行的截图服务"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.process: Optional[subprocess.Popen] = None
+
+    async def start(self, client: httpx.AsyncClient):
+        """启动服务并等待就绪检查通过"""
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        deadline = time.monotonic() + SERVICE_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"服务启动失败，退出码 {self.process.returncode}")
+            try:
+                response = await client.get(f"{self.base_url}/health/ready")
+                if response.status_code == 200:
+                    return
+                if "browser_disconnected" in response.json().get("reasons", []):
+                    self.stop()
+                    raise SystemExit("服务的浏览器未启动，请先执行 playwright install firefox")
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+        self.stop()
+        raise SystemExit("等待服务就绪超时")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class LoadRun:
+    """一个压测级别的请求记录"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.perf_counter()
+        self.finished_at = self.started_at
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # 服务端排队状态的时间序列
+        self.queue_samples: List[Dict[str, Any]] = []
+
+    def begin(self):
+        self.sent += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self, status: str, latency: float):
+        self.in_flight -= 1
+        self.statuses[status] += 1
+        if status == "200":
+            self.latencies.append(latency)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = self.finished_at - self.started_at
+        completed = sum(self.statuses.values())
+        ok = self.statuses.get("200", 0)
+        latency = summarize(self.latencies)
+        return {
+            "level": self.label,
+            "duration_s": round(elapsed, 1),
+            "sent": self.sent,
+            "completed": completed,
+            "ok": ok,
+            "error_rate": round(1 - ok / completed, 3) if completed else None,
+            "throughput_rps": round(ok / elapsed, 3) if elapsed > 0 else None,
+            "latency": latency,
+            "p50": latency["p50"],
+            "p95": latency["p95"],
+            "p99": latency["p99"],
+            "max_in_flight": self.max_in_flight,
+            "max_queue_depth": max((sample["queue_depth"] for sample in self.queue_samples), default=None),
+            "statuses": dict(self.statuses),
+            "queue": self.queue_samples,
+        }
+
+
+async def send_capture(client: httpx.AsyncClient, base_url: str, target_url: str,
+                       run: LoadRun, args) -> None:
+    """发送一次长截图请求并记录结果"""
+    run.begin()
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{base_url}/douyin/long-screenshot",
+            json={"url": target_url, "cache": args.cache, "output_format": args.output_format}
+        )
+        status = str(response.status_code)
+    except httpx.TimeoutException:
+        status = "timeout"
+    except httpx.TransportError as e:
+        status = type(e).__name__
+    run.end(status, time.perf_counter() - started)
+
+
+async def poll_queue(client: httpx.AsyncClient, base_url: str, run: LoadRun, interval: float):
+    """定期记录服务端执行中和排队中的截图数"""
+    while True:
+        try:
+            stats = (await client.get(f"{base_url}/douyin/queue")).json()
+            run.queue_samples.append({
+                "t": round(time.perf_counter() - run.started_at, 1),
+                "in_flight": stats.get("in_flight"),
+                "queue_depth": stats.get("queue_depth"),
+            })
+        except (httpx.HTTPError, ValueError):
+            pass
+        await asyncio.sleep(interval)
+
+
+async def closed_loop(client, base_url, urls, run: LoadRun, concurrency: int, args):
+    """固定并发：每个客户端收到响应后立即发送下一个请求"""
+    stop_at = time.perf_counter() + args.duration
+
+    async def worker():
+        while time.perf_counter() < stop_at and (not args.requests or run.sent < args.requests):
+            await send_capture(client, base_url, next(urls), run, args)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(client, base_url, urls, run: LoadRun, rate: float, args):
+    """固定到达速率：按时间表发送请求，不等待前面的响应"""
+    stop_at = time.perf_counter() + args.duration
+    tasks = set()
+    next_at = time.perf_counter()
+    while next_at < stop_at and (not args.requests or run.sent < args.requests):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(send_capture(client, base_url, next(urls), run, args))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        interval = random.expovariate(rate) if args.arrival == "poisson" else 1 / rate
+        next_at += interval
+    # 等待已发送的请求完成
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def run_load_test(args) -> Dict[str, Any]:
+    page_server, page_base_url = start_server(host=args.page_host)
+    # 每个请求使用不同的seed，避免被结果缓存或合并
+    urls = (
+        page_url(page_base_url, items=args.items, image_delay=args.image_delay, seed=seed)
+        for seed in itertools.count(1)
+    )
+    if args.same_url:
+        url = page_url(page_base_url, items=args.items, image_delay=args.image_delay)
+        urls = itertools.repeat(url)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    service = None
+    results = []
+    timeline: List[Dict[str, Any]] = []
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        try:
+            base_url = args.base_url
+            if not base_url:
+                service = ServiceProcess(_free_port())
+                print("正在启动服务...")
+                await service.start(client)
+                base_url = service.base_url
+            if psutil is None:
+                print("未安装psutil，不统计服务和浏览器内存")
+
+            levels = args.concurrency or args.rate
+            for level in levels:
+                label = f"c={int(level)}" if args.concurrency else f"rate={level:g}/s"
+                run = LoadRun(label)
+                sampler = ResourceSampler(interval=1.0, pid=service.process.pid) if service else None
+                if sampler:
+                    sampler.start()
+                poller = asyncio.create_task(poll_queue(client, base_url, run, 1.0))
+                print(f"[{label}] 压测 {args.duration:.0f} 秒...")
+                try:
+                    if args.concurrency:
+                        await closed_loop(client, base_url, urls, run, int(level), args)
+                    else:
+                        await open_loop(client, base_url, urls, run, level, args)
+                finally:
+                    run.finished_at = time.perf_counter()
+                    poller.cancel()
+                    resources = sampler.stop() if sampler else {}
+                summary = run.summary()
+                summary["peak_service_mb"] = resources.get("peak_rss_mb")
+                summary["peak_browser_mb"] = resources.get("peak_browser_rss_mb")
+                results.append(summary)
+                if sampler:
+                    timeline.append({"level": label, "memory": sampler.samples})
+                print(f"[{label}] 成功 {summary['ok']}/{summary['completed']}, "
+                      f"吞吐量 {summary['throughput_rps']}/s, p95 {summary['p95']}s, 状态 {summary['statuses']}")
+                if args.cooldown:
+                    await asyncio.sleep(args.cooldown)
+        finally:
+            if service:
+                service.stop()
+            page_server.shutdown()
+    return {"results": results, "memory_timeline": timeline}
+
+
+def _levels(value: str) -> List[float]:
+    return [float(level) for level in value.split(",") if level.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长截图服务压力测试")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=_levels, help="逗号分隔的并发级别（闭环）")
+    mode.add_argument("--rate", type=_levels, help="逗号分隔的到达速率，单位请求/秒（开环）")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant", help="开环到达间隔分布")
+    parser.add_argument("--duration", type=float, default=60.0, help="每个级别的压测时长（秒）")
+    parser.add_argument("--requests", type=int, default=0, help="每个级别最多发送的请求数，0为不限")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="级别之间的间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=300.0, help="单个请求的客户端超时（秒）")
+    parser.add_argument("--base-url", help="压测已运行的服务，默认在子进程中启动")
+    parser.add_argument("--page-host", default="127.0.0.1", help="合成页面服务器监听地址，也是被测服务访问合成页面使用的地址")
+    parser.add_argument("--items", type=int, default=40, help="合成页面内容条数")
+    parser.add_argument("--image-delay", type=int, default=0, help="合成页面图片延迟（毫秒）")
+    parser.add_argument("--same-url", action="store_true", help="所有请求使用同一URL（测试缓存和合并）")
+    parser.add_argument("--cache", choices=["prefer", "bypass"], default="bypass", help="请求的缓存策略")
+    parser.add_argument("--output-format", default="png", help="请求的输出格式")
+    parser.add_argument("--json", help="结果保存路径（包含排队和内存时间序列）")
+    args = parser.parse_args()
+    if not args.concurrency and not args.rate:
+        args.concurrency = [1.0, 2.0, 4.0]
+
+    report = asyncio.run(run_load_test(args))
+
+    print()
+    print_table(report["results"], ["level", "duration_s", "sent", "ok", "error_rate", "throughput_rps",
+                                    "p50", "p95", "p99", "max_in_flight", "max_queue_depth",
+                                    "peak_service_mb", "peak_browser_mb"])
+    if args.json:
+        write_json(args.json, {"args": vars(args), **report})
+
+
+if __name__ == "__main__":
+    main()
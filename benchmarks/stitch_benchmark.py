@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+拼接编码微基准 - 用合成帧测量_stitch_screenshots在不同像素比、帧数和输出方式下的耗时、峰值内存和输出大小
+
+不启动浏览器，只测量流水线中CPU密集的部分。每次测量在独立子进程中执行，
+峰值内存取子进程的ru_maxrss，rss_delta_mb为拼接前后峰值之差（排除解释器和模块导入的内存）。
+
+用法:
+    python -m benchmarks.stitch_benchmark
+    python -m benchmarks.stitch_benchmark --dpr 3 --frames 10,40 --variants png_stream,png_canvas,webp --repeat 5
+"""
+from typing import Optional, Dict, Any, List
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from PIL import Image, ImageDraw
+
+# 视口大小（CSS像素），与浏览器上下文一致
+VIEWPORT = (390, 844)
+
+# 输出方式：长截图选项和需要临时修改的配置
+VARIANTS: Dict[str, Dict[str, Any]] = {
+    "png_stream": {"options": {}, "settings": {"stream_png_output": True}},
+    "png_stream_up": {"options": {"png_filter": "up"}, "settings": {"stream_png_output": True}},
+    "png_stream_sub": {"options": {"png_filter": "sub"}, "settings": {"stream_png_output": True}},
+    "png_canvas": {"options": {}, "settings": {"stream_png_output": False}},
+    "png_fast": {"options": {"png_compress_level": 1}, "settings": {"stream_png_output": True}},
+    "jpeg": {"options": {"output_format": "jpeg"}},
+    "webp": {"options": {"output_format": "webp"}},
+    "avif": {"options": {"output_format": "avif"}},
+    "trim": {"options": {"trim_blank": True}},
+    "thumbnail": {"options": {"thumbnail_width": 390, "preview_height": 2000}},
+    "tiles": {"options": {"tiles": True}},
+}
+
+DEFAULT_VARIANTS = ("png_stream", "png_stream_up", "png_canvas", "png_fast", "jpeg", "webp", "trim")
+
+
+def generate_frames(directory: str, dpr: int, count: int, seed: int = 1) -> List[str]:
+    """
+    生成合成截图帧：文字行、图片块和空白区域，每帧内容不同
+
+    Returns:
+        帧文件路径列表
+    """
+    width, height = VIEWPORT[0] * dpr, VIEWPORT[1] * dpr
+    rng = random.Random(seed)
+    paths = []
+    for index in range(count):
+        image = Image.new("RGB", (width, height), (22, 24, 35))
+        draw = ImageDraw.Draw(image)
+        y = 0
+        while y < height:
+            block = rng.random()
+            if block < 0.5:
+                # 模拟文字行：一行随机长度的短横条
+                line_height = 22 * dpr
+                x = 16 * dpr
+                while x < width - 40 * dpr:
+                    word = rng.randint(8, 40) * dpr
+                    draw.rectangle((x, y + 6 * dpr, x + word, y + 16 * dpr), fill=(200, 200, 205))
+                    x += word + 6 * dpr
+                y += line_height
+            elif block < 0.8:
+                # 模拟图片：渐变色块
+                block_height = rng.randint(120, 240) * dpr
+                start = [rng.randint(0, 255) for _ in range(3)]
+                for row in range(0, block_height, 4):
+                    shade = tuple((channel + row // 4) % 256 for channel in start)
+                    draw.rectangle((16 * dpr, y + row, width - 16 * dpr, y + row + 3), fill=shade)
+                y += block_height + 12 * dpr
+            else:
+                # 空白区域
+                y += rng.randint(20, 160) * dpr
+        path = os.path.join(directory, f"frame_{dpr}x_{index:03d}.png")
+        image.save(path, compress_level=1)
+        image.close()
+        paths.append(path)
+    return paths
+
+
+def run_worker(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """在子进程中执行一次拼接（由--worker调用）"""
+    from app.core.config import settings
+    from app.models.douyin import LongScreenshotOptions
+    from app.services.playwright_service import playwright_service
+    from app.utils.metrics import StageTimer
+    from benchmarks.common import max_rss_mb
+
+    variant = VARIANTS[spec["variant"]]
+    for key, value in variant.get("settings", {}).items():
+        setattr(settings, key, value)
+    options = LongScreenshotOptions(**variant["options"])
+    timer = StageTimer()
+
+    baseline_rss = max_rss_mb()
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    result = asyncio.run(playwright_service._stitch_screenshots(
+        spec["frames"], spec["output_path"], spec["crop"], options, timer
+    ))
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    peak_rss = max_rss_mb()
+
+    output_bytes = result["file_size"]
+    for field in ("thumbnail_path", "preview_path"):
+        if result.get(field):
+            output_bytes += os.path.getsize(result[field])
+    if result.get("tiles"):
+        for root, _, files in os.walk(result["tiles"]["tiles_dir"]):
+            output_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+
+    return {
+        "wall": wall,
+        "cpu": cpu,
+        "encode": timer.durations.get("encode"),
+        "write": timer.durations.get("write"),
+        "peak_rss_mb": peak_rss,
+        "rss_delta_mb": peak_rss - baseline_rss,
+        "output_bytes": output_bytes,
+        "output_format": result["output_format"],
+        "height": result["total_height"],
+    }
+
+
+def measure(frames: List[str], variant: str, crop: int, output_dir: str) -> Dict[str, Any]:
+    """启动子进程执行一次拼接"""
+    spec = {
+        "frames": frames,
+        "variant": variant,
+        "crop": crop,
+        "output_path": os.path.join(output_dir, f"stitch_{variant}.png"),
+    }
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.stitch_benchmark", "--worker", json.dumps(spec)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "子进程执行失败")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def aggregate(dpr: int, count: int, variant: str, runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总重复测量：耗时取中位数，内存取最大值"""
+    def median_ms(key: str) -> Optional[float]:
+        values = [run[key] for run in runs if run[key] is not None]
+        return round(statistics.median(values) * 1000, 1) if values else None
+
+    return {
+        "dpr": dpr,
+        "frames": count,
+        "variant": variant,
+        "format": runs[0]["output_format"],
+        "height": runs[0]["height"],
+        "wall_ms": median_ms("wall"),
+        "cpu_ms": median_ms("cpu"),
+        "encode_ms": median_ms("encode"),
+        "write_ms": median_ms("write"),
+        "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+        "rss_delta_mb": round(max(run["rss_delta_mb"] for run in runs), 1),
+        "output_kb": round(runs[0]["output_bytes"] / 1024, 1),
+    }
+
+
+def run_benchmark(args) -> List[Dict[str, Any]]:
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for dpr in args.dpr:
+            frame_dir = os.path.join(temp_dir, f"frames_{dpr}x")
+            os.makedirs(frame_dir)
+            print(f"生成 {max(args.frames)} 张 {dpr}x 合成帧...")
+            all_frames = generate_frames(frame_dir, dpr, max(args.frames))
+            for count in args.frames:
+                for variant in args.variants:
+                    output_dir = os.path.join(temp_dir, f"out_{dpr}x_{count}_{variant}")
+                    os.makedirs(output_dir)
+                    try:
+                        runs = [measure(all_frames[:count], variant, args.crop, output_dir)
+                                for _ in range(args.repeat)]
+                    except RuntimeError as e:
+                        print(f"[{dpr}x {count}帧 {variant}] 失败: {e}")
+                        continue
+                    row = aggregate(dpr, count, variant, runs)
+                    print(f"[{dpr}x {count}帧 {variant}] {row['wall_ms']}ms, "
+                          f"峰值 {row['peak_rss_mb']}MB, 输出 {row['output_kb']}KB")
+                    results.append(row)
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="拼接编码微基准")
+    parser.add_argument("--dpr", type=_int_list, default=[1, 2, 3], help="逗号分隔的设备像素比")
+    parser.add_argument("--frames", type=_int_list, default=[2, 5, 10, 20, 40], help="逗号分隔的帧数")
+    parser.add_argument("--variants", default=",".join(DEFAULT_VARIANTS),
+                        help=f"逗号分隔的输出方式，可选: {', '.join(VARIANTS)}")
+    parser.add_argument("--crop", type=int, default=300, help="除最后一帧外每帧底部裁剪的像素，默认与长截图一致")
+    parser.add_argument("--repeat", type=int, default=3, help="每个组合的重复次数")
+    parser.add_argument("--json", help="结果保存路径")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    from benchmarks.common import print_table, write_json
+
+    args.variants = [variant.strip() for variant in args.variants.split(",") if variant.strip()]
+    unknown = [variant for variant in args.variants if variant not in VARIANTS]
+    if unknown:
+        parser.error(f"未知的输出方式: {', '.join(unknown)}")
+
+    results = run_benchmark(args)
+    print()
+    print_table(results, ["dpr", "frames", "variant", "format", "height", "wall_ms", "cpu_ms", "encode_ms",
+                          "write_ms", "peak_rss_mb", "rss_delta_mb", "output_kb"])
+    if args.json:
+        write_json(args.json, {"args": vars(args), "results": results})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+合成页面服务器 - 在本地提供结构类似抖音详情页的测试页面，使基准测试不依赖线上页面
+
+页面结构：
+- 内部滚动容器 .detail-container__body（body本身不滚动）
+- 容器内吸顶的标题栏和固定在视口底部的评论栏
+- 客户端渲染：内容在hydrate_ms毫秒后由脚本生成
+- 懒加载图片：进入容器可视区域附近时才设置src，图片响应可以设置延迟
+
+页面参数（查询字符串）：
+    items        内容条数，决定页面长度，默认40
+    image_every  每隔几条内容插入一张图片，0为不插入，默认1
+    image_delay  图片响应延迟（毫秒），默认0
+    hydrate_ms   渲染内容前的延迟（毫秒），默认300
+    seed         内容随机种子，默认1
+
+用法:
+    python -m benchmarks.synthetic_page --port 8765
+    打开 http://127.0.0.1:8765/page?items=80
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Tuple
+from urllib.parse import urlsplit, parse_qs, urlencode
+import argparse
+import html
+import json
+import random
+import threading
+import time
+
+PAGE_DEFAULTS = {
+    "items": 40,
+    "image_every": 1,
+    "image_delay": 0,
+    "hydrate_ms": 300,
+    "seed": 1,
+}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>{title}</title>
+<style>
+  html, body {{ margin: 0; height: 100%; overflow: hidden; font-family: sans-serif; background: #161823; color: #fff; }}
+  .detail-container__body {{ position: absolute; top: 0; left: 0; right: 0; bottom: 0; overflow-y: auto; }}
+  .sticky-header {{ position: sticky; top: 0; z-index: 2; height: 48px; line-height: 48px; padding: 0 16px;
+                   background: #161823; border-bottom: 1px solid #333; font-weight: bold; }}
+  .comment-bar {{ position: fixed; left: 0; right: 0; bottom: 0; z-index: 3; height: 56px; line-height: 56px;
+                 padding: 0 16px; background: #252632; color: #999; }}
+  .item {{ padding: 12px 16px; border-bottom: 1px solid #2a2b36; }}
+  .item .author {{ font-size: 14px; color: #aaa; margin-bottom: 6px; }}
+  .item p {{ margin: 0 0 8px; font-size: 15px; line-height: 1.5; }}
+  .item img {{ display: block; width: 100%; height: 220px; background: #2a2b36; }}
+  .footer-space {{ height: 72px; }}
+</style>
+</head>
+<body>
+<div class="detail-container__body">
+  <div class="sticky-header">{title}</div>
+  <div id="content"></div>
+  <div class="footer-space"></div>
+</div>
+<div class="comment-bar">善语结善缘，恶言伤人心</div>
+<script>
+  const ITEMS = {items_json};
+  setTimeout(() => {{
+    const content = document.getElementById('content');
+    const container = document.querySelector('.detail-container__body');
+    const observer = new IntersectionObserver((entries) => {{
+      for (const entry of entries) {{
+        if (entry.isIntersecting) {{
+          entry.target.src = entry.target.dataset.src;
+          observer.unobserve(entry.target);
+        }}
+      }}
+    }}, {{ root: container, rootMargin: '200px 0px' }});
+    for (const item of ITEMS) {{
+      const div = document.createElement('div');
+      div.className = 'item';
+      div.innerHTML = '<div class="author">' + item.author + '</div><p>' + item.text + '</p>';
+      if (item.image) {{
+        const img = document.createElement('img');
+        img.dataset.src = item.image;
+        div.appendChild(img);
+        observer.observe(img);
+      }}
+      content.appendChild(div);
+    }}
+  }}, {hydrate_ms});
+</script>
+</body>
+</html>
+"""
+
+WORDS = ["抖音", "长截图", "评论", "点赞", "收藏", "转发", "合集", "直播", "音乐", "话题",
+         "今天", "分享", "生活", "记录", "美食", "旅行", "推荐", "热门", "同款", "关注"]
+
+
+def _int_param(query: dict, name: str) -> int:
+    try:
+        return int(query.get(name, [PAGE_DEFAULTS[name]])[0])
+    except ValueError:
+        return PAGE_DEFAULTS[name]
+
+
+def render_page(query: dict) -> str:
+    """根据查询参数生成页面HTML"""
+    items = _int_param(query, "items")
+    image_every = _int_param(query, "image_every")
+    image_delay = _int_param(query, "image_delay")
+    hydrate_ms = _int_param(query, "hydrate_ms")
+    rng = random.Random(_int_param(query, "seed"))
+
+    entries = []
+    for index in range(items):
+        text = "".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40)))
+        entry = {"author": f"用户{rng.randint(1000, 9999)}", "text": f"#{index + 1} {text}"}
+        if image_every and index % image_every == 0:
+            entry["image"] = f"/image/{index}.svg?" + urlencode({"seed": rng.randint(0, 1 << 24), "delay": image_delay})
+        entries.append(entry)
+
+    return PAGE_TEMPLATE.format(
+        title=html.escape(f"合成测试页面 ({items} 条)"),
+        items_json=json.dumps(entries, ensure_ascii=False).replace("</", "<\\/"),
+        hydrate_ms=hydrate_ms
+    )
+
+
+def render_image(seed: int) -> str:
+    """生成一张带渐变和文字的SVG图片，颜色由seed决定"""
+    rng = random.Random(seed)
+    start = f"#{rng.randint(0, 0xFFFFFF):06x}"
+    stop = f"#{rng.randint(0, 0xFFFFFF):06x}"
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="390" height="220">'
+        f'<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1"><stop offset="0" stop-color="{start}"/>'
+        f'<stop offset="1" stop-color="{stop}"/></linearGradient></defs>'
+        '<rect width="390" height="220" fill="url(#g)"/>'
+        f'<text x="20" y="120" font-size="28" fill="#fff">IMG {seed}</text></svg>'
+    )
+
+
+class SyntheticPageHandler(BaseHTTPRequestHandler):
+    """合成页面请求处理"""
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path in ("/", "/page"):
+            self._send(200, "text/html; charset=utf-8", render_page(query))
+        elif parts.path.startswith("/image/"):
+            try:
+                delay = int(query.get("delay", ["0"])[0])
+                seed = int(query.get("seed", ["0"])[0])
+            except ValueError:
+                self._send(400, "text/plain; charset=utf-8", "bad request")
+                return
+            if delay > 0:
+                time.sleep(delay / 1000)
+            self._send(200, "image/svg+xml", render_image(seed), cache=True)
+        else:
+            self._send(404, "text/plain; charset=utf-8", "not found")
+
+    def _send(self, status: int, content_type: str, body: str, cache: bool = False):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "public, max-age=3600" if cache else "no-store")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 基准测试时不输出访问日志
+        pass
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    在后台线程中启动合成页面服务器
+
+    Args:
+        host: 监听地址
+        port: 监听端口，0为随机端口
+
+    Returns:
+        服务器对象（用完调用shutdown）和基础URL
+    """
+    server = ThreadingHTTPServer((host, port), SyntheticPageHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def page_url(base_url: str, **params) -> str:
+    """生成合成页面URL，参数见模块说明"""
+    query = {key: value for key, value in params.items() if value is not None}
+    return f"{base_url}/page" + (f"?{urlencode(query)}" if query else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成抖音页面服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), SyntheticPageHandler)
+    print(f"合成页面服务器已启动: http://{args.host}:{args.port}/page?items=40")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
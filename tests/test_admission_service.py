@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+准入控制测试 - 名额分配、优先级调度和排队拒绝
+"""
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.api.health import readiness
+from app.core.config import settings
+from app.services.admission_service import AdmissionController, AdmissionRejectedError
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "max_inflight_captures", 2)
+    monkeypatch.setattr(settings, "reserved_interactive_slots", 1)
+    monkeypatch.setattr(settings, "capture_queue_size", 2)
+    monkeypatch.setattr(settings, "ready_queue_threshold", None)
+
+
+def test_grants_free_slots_then_queues():
+    async def run():
+        controller = AdmissionController()
+        first = controller.admit(priority="interactive")
+        second = controller.admit(priority="interactive")
+        third = controller.admit(priority="interactive")
+        assert first.granted and second.granted and not third.granted
+        assert controller.queue_depth == 1
+
+        first.release()
+        await third.wait()
+        assert third.granted
+        assert controller.active == 2
+
+    asyncio.run(run())
+
+
+def test_reserved_slot_only_for_interactive():
+    async def run():
+        controller = AdmissionController()
+        bulk = controller.admit(priority="bulk")
+        queued_bulk = controller.admit(wait=True, priority="bulk")
+        assert bulk.granted and not queued_bulk.granted
+        interactive = controller.admit(priority="interactive")
+        assert interactive.granted
+
+    asyncio.run(run())
+
+
+def test_higher_priority_scheduled_first():
+    async def run():
+        controller = AdmissionController()
+        running = [controller.admit(priority="interactive") for _ in range(2)]
+        bulk = controller.admit(wait=True, priority="bulk")
+        normal = controller.admit(wait=True, priority="normal")
+        running[0].release()
+        await normal.wait()
+        assert normal.granted and not bulk.granted
+
+    asyncio.run(run())
+
+
+def test_promote_raises_queue_position():
+    async def run():
+        controller = AdmissionController()
+        running = [controller.admit(priority="interactive") for _ in range(2)]
+        normal = controller.admit(wait=True, priority="normal")
+        bulk = controller.admit(wait=True, priority="bulk")
+        bulk.promote("interactive")
+        running[0].release()
+        await bulk.wait()
+        assert bulk.granted and not normal.granted
+
+    asyncio.run(run())
+
+
+def test_rejects_when_queue_full():
+    async def run():
+        controller = AdmissionController()
+        # 普通请求只能使用1个共享名额，其余2个进入队列
+        for _ in range(3):
+            controller.admit(priority="normal")
+        with pytest.raises(AdmissionRejectedError) as error:
+            controller.admit(priority="normal")
+        assert error.value.queue_depth == 2
+        assert error.value.retry_after >= 1
+        assert controller.rejected == 1
+        # 自身已经限流的调用方只排队不被拒绝
+        assert not controller.admit(wait=True, priority="normal").granted
+
+    asyncio.run(run())
+
+
+def test_bulk_backlog_does_not_reject_interactive(monkeypatch):
+    """积压的批量请求不会让交互请求被拒绝，也不会让实例变为不就绪"""
+    async def run():
+        controller = AdmissionController()
+        monkeypatch.setattr("app.api.health.admission_controller", controller)
+        running = [controller.admit(priority="interactive") for _ in range(2)]
+        for _ in range(5):
+            controller.admit(wait=True, priority="bulk")
+        assert controller.queue_depth == 5
+
+        interactive = controller.admit(priority="interactive")
+        assert not interactive.granted
+        assert controller.queue_depth_for("interactive") == 1
+        assert "saturated" not in readiness()["reasons"]
+
+        controller.admit(priority="interactive")
+        with pytest.raises(AdmissionRejectedError):
+            controller.admit(priority="interactive")
+        assert "saturated" in readiness()["reasons"]
+        # 批量请求前面的排队数包括所有更高优先级的请求
+        with pytest.raises(AdmissionRejectedError):
+            controller.admit(priority="bulk")
+        running[0].release()
+        await interactive.wait()
+        assert interactive.granted
+
+    asyncio.run(run())
+
+
+def test_cancel_while_queued():
+    async def run():
+        controller = AdmissionController()
+        running = [controller.admit(priority="interactive") for _ in range(2)]
+        queued = controller.admit(priority="normal")
+        queued.release()
+        assert controller.queue_depth == 0
+        running[0].release()
+        assert controller.active == 1
+
+    asyncio.run(run())
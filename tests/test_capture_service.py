@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+截图调度测试 - 结果缓存键与浏览器最终地址
+"""
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core.config import settings
+from app.models.douyin import LongScreenshotOptions
+from app.services import capture_service as capture_module
+from app.services.admission_service import AdmissionController
+from app.services.capture_service import CaptureService
+from app.services.playwright_service import playwright_service
+from app.services.result_cache import ResultCache
+
+
+class _FakeResponse:
+    def __init__(self, url: str):
+        self.url = url
+
+
+class _FakeClient:
+    """HEAD请求返回固定的跳转地址"""
+
+    def __init__(self, final_url: str):
+        self.final_url = final_url
+
+    async def head(self, url: str):
+        return _FakeResponse(self.final_url)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """使用临时缓存目录和假截图的调度服务，返回(服务, 截图次数列表)"""
+    screenshot_dir = tmp_path / "screenshots"
+    screenshot_dir.mkdir()
+    monkeypatch.setattr(settings, "cache_enabled", True)
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "cache_index_file", str(tmp_path / "cache_index.json"))
+
+    cache = ResultCache()
+    # 短链接HEAD解析到的地址与浏览器最终到达的地址不同（例如带有不同的查询参数）
+    cache._client = _FakeClient("https://www.douyin.com/video/1?previous_page=app_code_link")
+    monkeypatch.setattr(capture_module, "result_cache", cache)
+
+    calls = []
+
+    async def fake_screenshot(url, options=None, progress_callback=None, **kwargs):
+        calls.append(url)
+        output_path = str(screenshot_dir / f"shot{len(calls)}.png")
+        with open(output_path, "wb") as f:
+            f.write(b"png")
+        return {
+            "success": True,
+            "output_path": output_path,
+            "file_size": 3,
+            "current_url": "https://www.douyin.com/video/1",
+        }
+
+    monkeypatch.setattr(playwright_service, "take_long_screenshot", fake_screenshot)
+    monkeypatch.setattr(playwright_service, "browser", object())
+    return CaptureService(), calls
+
+
+def test_identical_requests_hit_cache(service):
+    """同一短链接连续请求两次，第二次命中缓存"""
+    capture_service, calls = service
+
+    async def run():
+        first = await capture_service.capture("https://v.douyin.com/abc/", LongScreenshotOptions())
+        second = await capture_service.capture("https://v.douyin.com/abc/", LongScreenshotOptions())
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["cache"] == "miss"
+    assert second["cache"] == "hit"
+    assert len(calls) == 1
+    assert os.path.exists(second["output_path"])
+
+
+def test_queue_timeout_recorded(service, monkeypatch):
+    """排队超时计入timeout结果和queue阶段耗时"""
+    capture_service, calls = service
+    monkeypatch.setattr(settings, "max_inflight_captures", 1)
+    monkeypatch.setattr(settings, "reserved_interactive_slots", 0)
+    monkeypatch.setattr(settings, "queue_timeout", 0.05)
+    controller = AdmissionController()
+    monkeypatch.setattr(capture_module, "admission_controller", controller)
+
+    def sample(name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    timeouts = sample("douyin_captures_total", {"outcome": "timeout"})
+    queue_waits = sample("douyin_capture_stage_seconds_count", {"stage": "queue"})
+
+    async def run():
+        running = controller.admit(priority="interactive")
+        result = await capture_service.capture("https://v.douyin.com/abc/", LongScreenshotOptions())
+        running.release()
+        return result
+
+    result = asyncio.run(run())
+    assert result["timeout"] and result["stage"] == "queue"
+    assert not calls
+    assert sample("douyin_captures_total", {"outcome": "timeout"}) == timeouts + 1
+    assert sample("douyin_capture_stage_seconds_count", {"stage": "queue"}) == queue_waits + 1
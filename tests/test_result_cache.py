@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+结果缓存测试 - 文件移动与容量淘汰
+"""
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.core.config import settings
+from app.services.result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "cache_index_file", str(tmp_path / "cache_index.json"))
+    return ResultCache()
+
+
+def _write_output(directory, name: str, size: int) -> str:
+    path = str(directory / name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_put_moves_outputs_into_cache(cache, tmp_path):
+    """输出文件移动到缓存目录，截图目录中不再保留原文件"""
+    output_path = _write_output(tmp_path, "shot.png", 100)
+    cached = asyncio.run(cache.put("k1", {"success": True, "output_path": output_path}))
+
+    assert not os.path.exists(output_path)
+    assert cached["output_path"].startswith(settings.cache_dir)
+    assert cached["file_size"] == 100
+    assert cache.stats()["bytes"] == 100
+
+
+def test_put_restores_outputs_on_failure(cache, tmp_path):
+    """部分文件移动失败时，已移动的文件移回原位置"""
+    output_path = _write_output(tmp_path, "shot.png", 100)
+    result = {"success": True, "output_path": output_path, "thumbnail_path": str(tmp_path / "missing.jpg")}
+    with pytest.raises(OSError):
+        asyncio.run(cache.put("k1", result))
+
+    assert os.path.exists(output_path)
+    assert cache.stats()["entries"] == 0
+
+
+def test_evict_keeps_inserted_entry(cache, tmp_path, monkeypatch):
+    """超出容量时淘汰旧条目，刚写入的条目即使单独超出上限也保留"""
+    monkeypatch.setattr(settings, "cache_max_bytes", 150)
+
+    async def run():
+        first = await cache.put("k1", {"success": True, "output_path": _write_output(tmp_path, "a.png", 100)})
+        second = await cache.put("k2", {"success": True, "output_path": _write_output(tmp_path, "b.png", 200)})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert cache.get("k1") is None
+    assert not os.path.exists(first["output_path"])
+    assert cache.get("k2") is not None
+    assert os.path.exists(second["output_path"])